@@ -0,0 +1,198 @@
+"""Benchmarks the separation engine against synthetic collections.
+
+Each size gets a freshly generated collection in a temporary folder, which is
+copied before every mode that modifies it. Example:
+
+    python bench/benchmark.py --cards 10000 100000 1000000 --siblings 3
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+import anki.collection  # isort:skip # must be imported before other anki modules
+from anki.buildinfo import version
+from anki.collection import Collection
+from anki.decks import DeckId
+from anki.lang import set_lang
+from anki.notes import Note
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from src.engine import DeckSeparator  # noqa: E402
+
+try:
+    from anki.collection import AddNoteRequest
+except ImportError:
+    AddNoteRequest = None  # type: ignore
+
+ROOT_DECK = "Bench"
+KEY_FIELD = "Key"
+WORDS = ["lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing"]
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--cards", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--note-types", type=int, default=1)
+    parser.add_argument("--siblings", type=int, default=1, help="cards per note")
+    parser.add_argument(
+        "--field-size", type=int, default=200, help="characters per text field"
+    )
+    parser.add_argument(
+        "--html-density",
+        type=float,
+        default=0.2,
+        help="fraction of words wrapped in HTML tags",
+    )
+    parser.add_argument("--depth", type=int, default=2, help="subdeck depth")
+    parser.add_argument(
+        "--values", type=int, default=100, help="distinct separator field values"
+    )
+    parser.add_argument(
+        "--group-size", type=int, default=100, help="cards per deck in count mode"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="record each phase's peak Python memory use (slows down the run)",
+    )
+    parser.add_argument("--json", help="also write the results to this file")
+    return parser.parse_args()
+
+
+def html_text(rng: random.Random, size: int, density: float) -> str:
+    words: List[str] = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        if rng.random() < density:
+            word = f"<b>{word}</b>"
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)
+
+
+def generate(path: str, cards: int, args: argparse.Namespace) -> None:
+    rng = random.Random(args.seed)
+    col = Collection(path)
+    mm = col.models
+    note_types = []
+    for i in range(args.note_types):
+        notetype = mm.new(f"Bench {i}")
+        for name in (KEY_FIELD, "Text"):
+            mm.add_field(notetype, mm.new_field(name))
+        for j in range(args.siblings):
+            template = mm.new_template(f"Card {j + 1}")
+            template["qfmt"] = f"{{{{{KEY_FIELD}}}}} {j + 1}"
+            template["afmt"] = "{{Text}}"
+            mm.add_template(notetype, template)
+        mm.add(notetype)
+        note_types.append(mm.by_name(f"Bench {i}"))
+    deck_ids = [col.decks.id(ROOT_DECK)]
+    for level in range(1, args.depth + 1):
+        name = "::".join([ROOT_DECK] + [f"Level {n}" for n in range(1, level + 1)])
+        deck_ids.append(col.decks.id(name))
+
+    batch: List[Note] = []
+    for i in range(cards // args.siblings):
+        note = col.new_note(note_types[i % len(note_types)])
+        value = f"value {rng.randrange(args.values)}"
+        if rng.random() < args.html_density:
+            value = f"<i>{value}</i>"
+        note[KEY_FIELD] = value
+        note["Text"] = html_text(rng, args.field_size, args.html_density)
+        batch.append(note)
+        if len(batch) == 1000:
+            add_notes(col, batch, deck_ids)
+            batch = []
+    add_notes(col, batch, deck_ids)
+    col.close()
+
+
+def add_notes(col: Collection, notes: List[Note], deck_ids: List[DeckId]) -> None:
+    if AddNoteRequest:
+        col.add_notes(
+            [
+                AddNoteRequest(note, deck_ids[i % len(deck_ids)])
+                for i, note in enumerate(notes)
+            ]
+        )
+    else:
+        for i, note in enumerate(notes):
+            col.add_note(note, deck_ids[i % len(deck_ids)])
+
+
+def measure(results: Dict[str, Any], phase: str, func: Callable[[], Any]) -> Any:
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    ret = func()
+    elapsed = time.perf_counter() - start
+    results[phase] = {"seconds": round(elapsed, 3)}
+    line = f"  {phase:<24} {elapsed:9.3f}s"
+    if tracemalloc.is_tracing():
+        peak = tracemalloc.get_traced_memory()[1] // 1024
+        results[phase]["peak_kib"] = peak
+        line += f" {peak:>10} KiB peak"
+    print(line, flush=True)
+    return ret
+
+
+def run_mode(
+    template_path: str, mode: str, results: Dict[str, Any], args: argparse.Namespace
+) -> None:
+    path = os.path.join(os.path.dirname(template_path), f"{mode}.anki2")
+    shutil.copy(template_path, path)
+    col = Collection(path)
+    try:
+        engine = DeckSeparator(col)
+        did = col.decks.id_for_name(ROOT_DECK)
+        measure(results, f"load_deck:{mode}", lambda: engine.load_deck(did))
+        mode_args = (
+            KEY_FIELD if mode == "field" else "",
+            args.group_size,
+            f"{ROOT_DECK} copy" if mode == "duplicate" else "",
+        )
+        measure(results, f"count_decks:{mode}", lambda: engine.count_decks(*mode_args))
+        measure(
+            results, f"process:{mode}", lambda: engine.process("Output", *mode_args)
+        )
+    finally:
+        col.close()
+
+
+def main() -> None:
+    args = parse_args()
+    set_lang("en")
+    report: Dict[str, Any] = {"args": vars(args), "anki": version, "runs": {}}
+    for cards in args.cards:
+        with tempfile.TemporaryDirectory() as folder:
+            template_path = os.path.join(folder, "template.anki2")
+            print(f"{cards} cards", flush=True)
+            results: Dict[str, Any] = {}
+            measure(results, "generate", lambda: generate(template_path, cards, args))
+            if args.trace_memory:
+                tracemalloc.start()
+            for mode in ("field", "count", "duplicate"):
+                run_mode(template_path, mode, results, args)
+            tracemalloc.stop()
+            report["runs"][cards] = results
+    # ru_maxrss is in KiB on Linux
+    report["max_rss_kib"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"max RSS: {report['max_rss_kib']} KiB")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Measures how long importing the add-on's modules takes.
+
+Each module is imported in a fresh interpreter that has already imported
+aqt, as Anki has by the time it loads add-ons. `gui` is what Anki imports on
+startup, and `dialog` what it used to import before the dialog was loaded
+lazily. Example:
+
+    python bench/import_time.py --runs 20
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Any, Dict, List
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+MODULES = ["gui", "dialog"]
+
+SNIPPET = """
+import importlib, sys, time
+sys.path.insert(0, {root!r})
+import aqt
+before = len(sys.modules)
+start = time.perf_counter()
+importlib.import_module("src.{module}")
+print(time.perf_counter() - start, len(sys.modules) - before)
+"""
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--runs", type=int, default=10, help="imports per module")
+    parser.add_argument("--json", help="also write the results to this file")
+    return parser.parse_args()
+
+
+def import_once(module: str) -> List[float]:
+    output = subprocess.run(
+        [sys.executable, "-c", SNIPPET.format(root=ROOT, module=module)],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    seconds, modules = output.split()
+    return [float(seconds), float(modules)]
+
+
+def main() -> None:
+    args = parse_args()
+    report: Dict[str, Any] = {"args": vars(args), "modules": {}}
+    for module in MODULES:
+        runs = [import_once(module) for _ in range(args.runs)]
+        median = statistics.median(seconds for seconds, _ in runs)
+        modules = int(runs[0][1])
+        report["modules"][module] = {
+            "median_ms": round(median * 1000, 2),
+            "modules_loaded": modules,
+        }
+        print(f"  {module:<24} {median * 1000:9.2f}ms {modules:>6} modules", flush=True)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence
+
+from anki.cards import CardId
+from anki.collection import Collection
+from anki.decks import DeckId
+from anki.utils import ids2str
+
+from .decks import DeckResolver, child_deck_name, move_cards
+from .engine import DeckSeparator
+from .metrics import RunMetrics
+from .progress import Cancelled
+from .rows import cid_array
+from .undo import UndoEntry
+
+
+def parent_deck_error(parent_deck: str, separator_field: str) -> str:
+    """Return an error message if separating several decks with the given
+    options would put cards of different decks in the same decks."""
+    if not separator_field and "{deck}" not in parent_deck:
+        return (
+            "Please include {deck} in the parent deck when separating several "
+            "decks by number of cards, so that their cards aren't mixed."
+        )
+    return ""
+
+
+class Source(NamedTuple):
+    name: str
+    cids: Sequence[CardId]
+    # Number of cards of each note if the cards were put in an order
+    note_sizes: Optional[List[int]] = None
+
+
+class BatchSeparator:
+    """Separates several deck trees with the same options as one operation.
+
+    The cards of all trees are read in one pass, the target decks are all
+    created before any card is moved, and all cards are moved in a single
+    undo step. Duplication isn't supported.
+    """
+
+    def __init__(
+        self, col: Collection, on_progress: Optional[Callable[[str], None]] = None
+    ):
+        self.col = col
+        self.engine = DeckSeparator(col, on_progress)
+        self.sources: List[Source] = []
+
+    def load_decks(self, dids: Sequence[DeckId], order: str = "") -> None:
+        """Collect the cards of the deck trees rooted at `dids`, in `order` if
+        given (see DeckSeparator.order_cards()). Decks inside other chosen decks
+        are only processed as part of their ancestors."""
+        self.engine.metrics = RunMetrics()
+        with self.engine.metrics.phase("load_decks") as phase:
+            self._load_decks(dids)
+            phase.items = sum(len(source.cids) for source in self.sources)
+        if order:
+            self.sources = [self._ordered(source, order) for source in self.sources]
+
+    def _ordered(self, source: Source, order: str) -> Source:
+        did = self.col.decks.id_for_name(source.name)
+        dids = [child[1] for child in self.col.decks.children(did)] + [did]
+        # Deck names can contain braces
+        escaped_name = source.name.replace("{", "{{").replace("}", "}}")
+        cids, note_sizes = self.engine.ordered_cids(
+            dids,
+            order,
+            len(source.cids),
+            self.engine.progress_reporter(
+                f"Sorted {{done}} out of {{total}} cards of {escaped_name}..."
+            ),
+        )
+        return Source(source.name, cids, note_sizes)
+
+    def _load_decks(self, dids: Sequence[DeckId]) -> None:
+        names = sorted(self.col.decks.name(did) for did in dids)
+        roots: List[str] = []
+        for name in names:
+            if not any(name.startswith(root + "::") for root in roots):
+                roots.append(name)
+        root_of: Dict[DeckId, int] = {}
+        for i, name in enumerate(roots):
+            did = self.col.decks.id_for_name(name)
+            for _, child_did in self.col.decks.children(did) + [(name, did)]:
+                root_of[child_did] = i
+        source_cids: List[List[CardId]] = [[] for _ in roots]
+        for cid, did in self.col.db.execute(
+            f"select id, did from cards where did in {ids2str(root_of)}"
+        ):
+            source_cids[root_of[did]].append(cid)
+        self.sources = [
+            Source(name, cid_array(cids)) for name, cids in zip(roots, source_cids)
+        ]
+
+    def collect_decks(
+        self, parent_deck: str, separator_field: str, number_of_cards: int
+    ) -> Dict[str, List[CardId]]:
+        """Group the loaded cards by the full name of the deck they should go to.
+
+        `parent_deck` can contain {deck} and {parent}, which are replaced by the
+        name of each source deck and of its parent.
+        """
+        decks: Dict[str, List[CardId]] = {}
+        total = sum(len(source.cids) for source in self.sources)
+        with self.engine.metrics.phase("collect_decks", total):
+            for name, cids, note_sizes in self.sources:
+                parent = parent_deck.replace("{deck}", name).replace(
+                    "{parent}", self.col.decks.immediate_parent(name) or ""
+                )
+                # Deck names can contain braces
+                escaped_name = name.replace("{", "{{").replace("}", "}}")
+                progress = self.engine.progress_reporter(
+                    f"Processed {{done}} out of {{total}} cards of {escaped_name}..."
+                )
+                for chunk in self.engine.chunks(
+                    separator_field,
+                    number_of_cards,
+                    "",
+                    cids,
+                    progress,
+                    note_sizes=note_sizes,
+                ):
+                    for stem, chunk_cids in chunk.items():
+                        decks.setdefault(child_deck_name(parent, stem), []).extend(
+                            chunk_cids
+                        )
+        return decks
+
+    def process(self, decks: Dict[str, List[CardId]]) -> int:
+        """Create the decks of collect_decks() and move their cards as a single
+        undoable operation. Returns the number of decks."""
+        undo = UndoEntry(self.col, "Separate Decks")
+        metrics = self.engine.metrics
+        title = "Separated " + ", ".join(source.name for source in self.sources)
+        try:
+            with metrics.phase("process", sum(len(cids) for cids in decks.values())):
+                resolver = DeckResolver(self.col, undo)
+                targets: Dict[DeckId, List[CardId]] = {}
+                progress = self.engine.progress_reporter(
+                    "Created {done} out of {total} decks..."
+                )
+                progress.start(len(decks))
+                for i, (name, cids) in enumerate(decks.items()):
+                    targets.setdefault(resolver.id(name), []).extend(cids)
+                    progress.update(i + 1)
+                progress.finish()
+                metrics.count("decks created", resolver.created)
+                moved = move_cards(
+                    self.col,
+                    targets,
+                    undo,
+                    self.engine.progress_reporter(
+                        "Moved {done} out of {total} cards..."
+                    ),
+                )
+                metrics.count("cards moved", moved)
+        except Cancelled:
+            undo.merge()
+            self.col.undo()
+            metrics.log(f"{title} (cancelled)")
+            raise
+        metrics.count("target decks", len(targets))
+        metrics.log(title)
+        return len(targets)
@@ -0,0 +1,143 @@
+import json
+import os
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple, cast
+
+from anki.cards import CardId
+from anki.collection import Collection
+from anki.decks import DeckId
+from anki.models import NotetypeId
+from anki.utils import ids2str
+
+_caches: Dict[str, "FieldCache"] = {}
+
+
+def write_json(path: str, data: Any) -> None:
+    "Write `data` to `path` so that the file is never left half-written."
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(data, file)
+    os.replace(tmp_path, path)
+
+
+def write_cids(path: str, cids: Sequence[CardId]) -> None:
+    "Write card ids to `path` as 64-bit integers, like write_json()."
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as file:
+        array("q", cids).tofile(file)
+    os.replace(tmp_path, path)
+
+
+def read_cids(path: str) -> Sequence[CardId]:
+    "Read card ids written by write_cids() into an array (see cid_array())."
+    cids = array("q")
+    with open(path, "rb") as file:
+        cids.frombytes(file.read())
+    return cast(Sequence[CardId], cids)
+
+
+def profile_cache(path: str, max_entries: int) -> "FieldCache":
+    "Return the cache stored at `path`, loading it on first use."
+    cache = _caches.get(path)
+    if cache is None:
+        cache = _caches[path] = FieldCache(path, max_entries)
+    cache.max_entries = max_entries
+    return cache
+
+
+def deck_stamp(
+    col: Collection, dids: List[DeckId], mids: List[NotetypeId]
+) -> List[int]:
+    """A cheap fingerprint of the cards in the given decks, their notes and
+    note types, which changes when the cards or fields of the decks might have."""
+    count, max_cid, max_card_mod, max_note_mod = col.db.first(
+        "select count(), max(c.id), max(c.mod), max(n.mod) "
+        "from cards c join notes n on c.nid = n.id "
+        f"where c.did in {ids2str(dids)}"
+    )
+    stamp = sorted(dids) + [count, max_cid or 0, max_card_mod or 0, max_note_mod or 0]
+    for mid in mids:
+        note_type = col.models.get(mid)
+        stamp.append(note_type["mod"] if note_type else 0)
+    return stamp
+
+
+class FieldCache:
+    """LRU cache of the cards and field names of deck trees, saved to files.
+
+    Entries are reused as is while the collection's modification time is
+    unchanged, and revalidated with deck_stamp() otherwise. The index of the
+    entries is saved to `path`, and the cards of each deck tree to a file of
+    their own in a folder next to it, so only the cards of the deck tree put
+    in the cache are written.
+    """
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.cids_dir = os.path.splitext(path)[0]
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        try:
+            with open(path, encoding="utf-8") as file:
+                self.entries.update(json.load(file))
+        except (OSError, ValueError):
+            pass
+
+    def get(
+        self, col: Collection, did: DeckId, dids: List[DeckId]
+    ) -> Optional[Tuple[Sequence[CardId], List[str]]]:
+        key = str(did)
+        entry = self.entries.get(key)
+        if not entry:
+            return None
+        if entry["col_mod"] != col.mod:
+            if entry["stamp"] != deck_stamp(col, dids, entry["mids"]):
+                self._remove(key)
+                return None
+            # Only kept in memory, as revalidating is cheap
+            entry["col_mod"] = col.mod
+        try:
+            cids = read_cids(self._cids_path(key))
+        except OSError:
+            self._remove(key)
+            return None
+        self.entries.move_to_end(key)
+        return cids, entry["fields"]
+
+    def put(
+        self,
+        col: Collection,
+        did: DeckId,
+        dids: List[DeckId],
+        mids: List[NotetypeId],
+        cids: Sequence[CardId],
+        fields: List[str],
+    ) -> None:
+        key = str(did)
+        write_cids(self._cids_path(key), cids)
+        self.entries[key] = {
+            "col_mod": col.mod,
+            "stamp": deck_stamp(col, dids, mids),
+            "mids": mids,
+            "fields": fields,
+        }
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self._remove(next(iter(self.entries)))
+        self.save()
+
+    def save(self) -> None:
+        write_json(self.path, self.entries)
+
+    def _cids_path(self, key: str) -> str:
+        return os.path.join(self.cids_dir, key)
+
+    def _remove(self, key: str) -> None:
+        del self.entries[key]
+        try:
+            os.remove(self._cids_path(key))
+        except OSError:
+            pass
@@ -0,0 +1,169 @@
+"""Run a separation or duplication directly on a collection file, without Anki's GUI.
+
+Example (from the add-on's parent folder, with Anki closed):
+
+    python -m deck_separator.cli collection.anki2 "Deck" --field Word
+"""
+
+import argparse
+import os
+import signal
+import sys
+import time
+from types import FrameType
+from typing import List, Optional
+
+from anki.collection import Collection
+from anki.lang import set_lang
+
+from . import consts
+from .engine import CARD_ORDERS, DeckSeparator
+from .journal import DuplicationJournal
+from .keys import TAGS, KeyExpression
+from .progress import Cancelled
+from .runs import RunLog
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Distribute cards to decks according to a field's contents "
+        "or a number of cards, or duplicate a deck."
+    )
+    parser.add_argument("collection", help="path to the .anki2 collection file")
+    parser.add_argument("deck", help="name of the deck to process")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--field", help="separate cards by this field's contents")
+    mode.add_argument(
+        "--key",
+        metavar="EXPRESSION",
+        help="separate cards by a key such as '{{Tags|tag:Lang|level:2}}'",
+    )
+    mode.add_argument(
+        "--cards", type=int, help="separate cards into decks of this many cards"
+    )
+    mode.add_argument("--duplicate", metavar="NAME", help="duplicate the deck as NAME")
+    parser.add_argument(
+        "--parent",
+        help="deck to create the new decks under (default: the deck's parent)",
+    )
+    parser.add_argument(
+        "--order",
+        choices=sorted(CARD_ORDERS),
+        help="with --cards, split the cards in this order, keeping siblings together",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="with --field or --key, only process notes changed since the last run",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="with --duplicate, continue an interrupted duplication",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="print the time taken by each phase of the run",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    if args.cards is not None and args.cards < 1:
+        print("--cards must be at least 1", file=sys.stderr)
+        return 2
+    # Normally done by Anki's GUI on startup; strip_html() needs it in newer versions
+    set_lang("en")
+    col = Collection(args.collection)
+    try:
+        return run(col, args)
+    finally:
+        col.close()
+
+
+def run(col: Collection, args: argparse.Namespace) -> int:
+    did = col.decks.id_for_name(args.deck)
+    if not did:
+        print(f"No deck named {args.deck}", file=sys.stderr)
+        return 1
+    engine = DeckSeparator(col, lambda text: print(text, file=sys.stderr))
+    # Runs are recorded per profile, which is named after the collection's folder
+    profile = os.path.basename(os.path.dirname(os.path.abspath(args.collection)))
+    engine.runs = RunLog(os.path.join(consts.USER_FILES, f"runs_{profile}.json"))
+    engine.journal = DuplicationJournal(
+        os.path.join(consts.USER_FILES, f"duplication_journal_{profile}.json")
+    )
+
+    def on_sigint(_signum: int, _frame: Optional[FrameType]) -> None:
+        engine.cancel.cancel()
+
+    signal.signal(signal.SIGINT, on_sigint)
+    try:
+        engine.load_deck(did)
+        if not engine.cids:
+            print(f"No cards in {args.deck}", file=sys.stderr)
+            return 1
+        separator_field = ""
+        if args.field:
+            separator_field = engine.get_field(args.field)
+            if not separator_field:
+                print(f"No field named {args.field} in {args.deck}", file=sys.stderr)
+                return 1
+        elif args.key:
+            try:
+                names = KeyExpression(args.key).names
+            except ValueError as exc:
+                print(exc, file=sys.stderr)
+                return 2
+            for name in names:
+                if name != TAGS and not engine.get_field(name):
+                    print(f"No field named {name} in {args.deck}", file=sys.stderr)
+                    return 1
+            separator_field = args.key
+        if args.cards and args.order:
+            engine.order_cards(args.order)
+        parent_deck = engine.parent_deck() if args.parent is None else args.parent
+        started = int(time.time())
+        cids = None
+        if separator_field and args.incremental:
+            cids = engine.changed_cids(separator_field, parent_deck)
+            if cids is not None and not cids:
+                print("No notes were changed since the last run")
+                return 0
+        resume = False
+        if args.duplicate and engine.can_resume(parent_deck, args.duplicate):
+            if args.resume:
+                resume = True
+            else:
+                print(
+                    "Starting over an interrupted duplication, removing the notes "
+                    "it added (use --resume to continue it instead)",
+                    file=sys.stderr,
+                )
+        # There's no confirmation to ask for, so the decks aren't counted first
+        count = engine.process(
+            parent_deck,
+            separator_field,
+            args.cards or 0,
+            args.duplicate or "",
+            cids,
+            resume,
+        )
+        if not count:
+            print("Chosen field is empty in all notes", file=sys.stderr)
+            return 1
+        if separator_field:
+            engine.record_run(separator_field, parent_deck, started, cids is not None)
+    except Cancelled:
+        print("Cancelled. No changes were made.", file=sys.stderr)
+        return 1
+    print(f"Processed {count} decks")
+    if args.stats:
+        print(engine.metrics.summary("\n"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,2 +1,5 @@
+import os
+
 ADDON_NAME = "Deck Separator"
 ADDON_LONG_NAME = "Distribute or duplicate cards"
+USER_FILES = os.path.join(os.path.dirname(__file__), "user_files")
@@ -0,0 +1,74 @@
+from typing import Mapping, Optional, Sequence
+
+from anki.cards import CardId
+from anki.collection import Collection
+from anki.decks import DeckId
+from anki.utils import ids2str
+
+from .progress import ProgressReporter
+from .undo import UndoEntry
+
+
+class DeckResolver:
+    """Maps deck names to ids, creating missing decks.
+
+    All existing deck names are read once, so only decks that don't exist yet
+    need a backend call.
+    """
+
+    def __init__(self, col: Collection, undo: UndoEntry):
+        self.col = col
+        self.undo = undo
+        # Number of decks created so far
+        self.created = 0
+        self.ids = {
+            entry.name: DeckId(entry.id) for entry in col.decks.all_names_and_ids()
+        }
+
+    def id(self, name: str) -> DeckId:
+        did = self.ids.get(name)
+        if did is None:
+            # Anki may still find an existing deck whose name differs in case
+            # or normalization
+            did = self.col.decks.id_for_name(name)
+            if not did:
+                did = self.col.decks.id(name)
+                self.undo.merge()
+                self.created += 1
+            self.ids[name] = did
+        return did
+
+
+def child_deck_name(parent_deck: str, name: str) -> str:
+    return f"{parent_deck}::{name}" if parent_deck else name
+
+
+def move_cards(
+    col: Collection,
+    targets: Mapping[DeckId, Sequence[CardId]],
+    undo: UndoEntry,
+    progress: Optional[ProgressReporter] = None,
+) -> int:
+    """Move cards to their target decks, merging all moves into `undo`.
+    Returns the number of cards moved.
+
+    Cards that are already in their target deck are left alone, so that
+    re-running a separation doesn't rewrite them."""
+    if progress:
+        progress.start(sum(len(cids) for cids in targets.values()))
+    done = 0
+    moved = 0
+    for did, cids in targets.items():
+        to_move = col.db.list(
+            f"select id from cards where id in {ids2str(cids)} and did != ?", did
+        )
+        if to_move:
+            col.set_deck(to_move, did)
+            undo.merge()
+            moved += len(to_move)
+        done += len(cids)
+        if progress:
+            progress.update(done)
+    if progress:
+        progress.finish()
+    return moved
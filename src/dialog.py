@@ -1,7 +1,7 @@
-import math
+import os
+import time
 from concurrent.futures import Future
-from itertools import zip_longest
-from typing import Dict, Iterable, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
 
 import anki
 from anki.cards import CardId
@@ -10,14 +10,18 @@ from aqt import qtmajor
 from aqt.deckchooser import DeckChooser
 from aqt.main import AnkiQt
 from aqt.qt import *
-from aqt.utils import askUserDialog, showWarning
+from aqt.utils import askUserDialog, showWarning, tooltip
 
 from . import consts
-
-try:
-    from anki.utils import strip_html
-except ImportError:
-    from anki.utils import stripHTML as strip_html
+from .batch import BatchSeparator, parent_deck_error
+from .cache import profile_cache
+from .decks import child_deck_name
+from .engine import DeckSeparator
+from .journal import DuplicationJournal
+from .keys import TAGS, KeyExpression
+from .metrics import RunMetrics, profiled
+from .progress import Cancelled, CancelToken, ProgressReporter
+from .runs import RunLog
 
 if qtmajor > 5:
     from .forms.form_qt6 import Ui_Dialog
@@ -28,8 +32,208 @@ else:
 ANKI_POINT_VERSION = int(anki.version.split(".")[-1])
 
 
-def groups_of_n(iterable: Iterable, n: int) -> Iterable:
-    return zip_longest(*[iter(iterable)] * n)
+# Number of decks above which the user is asked to confirm
+DECK_LIMIT = 25
+# Choices of the order cards are split in by number of cards (see CARD_ORDERS)
+CARD_ORDER_LABELS = [
+    ("", "In the deck's order"),
+    ("due", "In due order"),
+    ("created", "In order of note creation"),
+    ("sort_field", "In order of sort field"),
+]
+
+
+def confirm_deck_count(parent: QWidget, count: int) -> bool:
+    if count <= DECK_LIMIT:
+        return True
+    dialog = askUserDialog(
+        f"""
+This will result in creating {count} decks. \
+Note that large deck list trees can break display and result in a blank screen \
+in Anki versions before 2.1.50. Are you sure you want to continue?
+                """,
+        ["Continue", "Abort"],
+        parent,
+        title=consts.ADDON_NAME,
+    )
+    dialog.setDefault(1)
+    return dialog.run() != "Abort"
+
+
+def ask_resume(parent: QWidget) -> Optional[bool]:
+    """Ask whether to resume an interrupted duplication. Returns None if the
+    user chose to abort."""
+    dialog = askUserDialog(
+        "A previous duplication of this deck with the same options was interrupted. "
+        "Do you want to resume it, or start over, removing the notes it added and "
+        "duplicating all notes again?",
+        ["Resume", "Start Over", "Abort"],
+        parent,
+        title=consts.ADDON_NAME,
+    )
+    dialog.setDefault(0)
+    answer = dialog.run()
+    if answer == "Abort":
+        return None
+    return answer == "Resume"
+
+
+def run_in_background(
+    mw: AnkiQt, task: Callable[[], Any], on_done: Callable[[Future], None], name: str
+) -> None:
+    "Run `task` in the background, profiling it if enabled in the config."
+    if mw.addonManager.getConfig(__name__)["profile_runs"]:
+        task = profiled(task, name)
+    mw.taskman.run_in_background(task, on_done=on_done)
+
+
+def show_result(mw: AnkiQt, text: str, metrics: Optional[RunMetrics]) -> None:
+    "Show `text` in a tooltip, followed by the run's metrics if enabled."
+    period = 3000
+    if metrics and mw.addonManager.getConfig(__name__)["show_run_stats"]:
+        text += "<br>" + metrics.summary("<br>")
+        period = 10000
+    tooltip(text, period=period, parent=mw)
+
+
+def report_progress(mw: AnkiQt, cancel: CancelToken, text: str) -> None:
+    "Show the progress of a background operation, cancelling it if asked to."
+
+    def update() -> None:
+        mw.progress.update(text)
+        if mw.progress.want_cancel():
+            cancel.cancel()
+
+    mw.taskman.run_on_main(update)
+
+
+def choose_decks(
+    mw: AnkiQt, parent: QWidget, selected_did: Optional[DeckId] = None
+) -> List[DeckId]:
+    "Let the user pick several (non-filtered) decks."
+    dialog = QDialog(parent)
+    dialog.setWindowTitle(consts.ADDON_NAME)
+    layout = QVBoxLayout(dialog)
+    layout.addWidget(QLabel("Choose the decks to process with the current options:"))
+    deck_list = QListWidget()
+    deck_list.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+    for entry in mw.col.decks.all_names_and_ids(include_filtered=False):
+        item = QListWidgetItem(entry.name, deck_list)
+        item.setData(Qt.ItemDataRole.UserRole, entry.id)
+        item.setSelected(entry.id == selected_did)
+    layout.addWidget(deck_list)
+    buttons = QDialogButtonBox()
+    buttons.addButton(QDialogButtonBox.StandardButton.Ok)
+    buttons.addButton(QDialogButtonBox.StandardButton.Cancel)
+    qconnect(buttons.accepted, dialog.accept)
+    qconnect(buttons.rejected, dialog.reject)
+    layout.addWidget(buttons)
+    if not dialog.exec():
+        return []
+    return [
+        DeckId(item.data(Qt.ItemDataRole.UserRole))
+        for item in deck_list.selectedItems()
+    ]
+
+
+def run_batch(
+    mw: AnkiQt,
+    parent: QWidget,
+    dids: Sequence[DeckId],
+    parent_deck: str,
+    separator_field: str,
+    number_of_cards: int,
+    on_success: Callable[[int, RunMetrics], None],
+    card_order: str = "",
+) -> None:
+    """Separate the given decks with the same options in the background,
+    calling `on_success` with the number of decks and the run's metrics once done."""
+    batch = BatchSeparator(mw.col)
+    batch.engine.on_progress = lambda text: report_progress(
+        mw, batch.engine.cancel, text
+    )
+
+    def collect_decks() -> Dict[str, List[CardId]]:
+        batch.load_decks(dids, card_order)
+        return batch.collect_decks(parent_deck, separator_field, number_of_cards)
+
+    def on_done(fut: Future) -> None:
+        try:
+            count = fut.result()
+        except Cancelled:
+            tooltip("Cancelled. No changes were made.", parent=parent)
+            return
+        finally:
+            mw.progress.finish()
+        on_success(count, batch.engine.metrics)
+
+    def on_done_collecting_decks(fut: Future) -> None:
+        try:
+            decks = fut.result()
+        except Cancelled:
+            return
+        finally:
+            mw.progress.finish()
+        if not decks:
+            showWarning(
+                "No cards to move in the chosen decks",
+                parent=parent,
+                title=consts.ADDON_NAME,
+            )
+            return
+        if not confirm_deck_count(parent, len(decks)):
+            return
+        batch.engine.cancel = CancelToken()
+        mw.progress.start(parent=parent, label="Creating decks...")
+        mw.progress.set_title(consts.ADDON_NAME)
+        run_in_background(mw, lambda: batch.process(decks), on_done, "process")
+
+    mw.progress.start(parent=parent, label="Reading cards...")
+    mw.progress.set_title(consts.ADDON_NAME)
+    run_in_background(mw, collect_decks, on_done_collecting_decks, "collect_decks")
+
+
+def run_job(mw: AnkiQt, job: Dict[str, Any]) -> None:
+    "Run a batch job from the add-on's config."
+    dids = []
+    for name in job.get("decks", []):
+        did = mw.col.decks.id_for_name(name)
+        if not did:
+            showWarning(f"No deck named {name}", parent=mw, title=consts.ADDON_NAME)
+            return
+        dids.append(did)
+    separator_field = job.get("key") or job.get("field") or ""
+    number_of_cards = job.get("cards") or 0
+    parent_deck = job.get("parent", "{parent}")
+    error = ""
+    if not dids:
+        error = "The job has no decks"
+    elif separator_field:
+        try:
+            KeyExpression(separator_field)
+        except ValueError as exc:
+            error = str(exc)
+    elif number_of_cards < 1:
+        error = "The job needs a field, key or number of cards"
+    else:
+        error = parent_deck_error(parent_deck, separator_field)
+    if error:
+        showWarning(error, parent=mw, title=consts.ADDON_NAME)
+        return
+
+    def on_success(count: int, metrics: RunMetrics) -> None:
+        show_result(mw, f"Processed {count} decks", metrics)
+        mw.reset()
+
+    run_batch(
+        mw,
+        mw,
+        dids,
+        parent_deck,
+        separator_field,
+        number_of_cards,
+        on_success,
+    )
 
 
 class MyDeckChooser(DeckChooser):
@@ -42,7 +246,8 @@ class MyDeckChooser(DeckChooser):
 
 
 class DeckSeparatorDialog(QDialog):
-    DECK_LIMIT = 25
+    # Maximum number of decks listed in the preview
+    PREVIEW_LIMIT = 500
 
     def __init__(
         self, mw: AnkiQt, parent: QWidget, starting_deck_id: Optional[DeckId] = None
@@ -50,47 +255,53 @@ class DeckSeparatorDialog(QDialog):
         super().__init__(parent)
         self.mw = mw
         self.config = mw.addonManager.getConfig(__name__)
+        self.engine = DeckSeparator(mw.col, self._on_progress)
+        if self.config["field_cache_size"]:
+            self.engine.cache = profile_cache(
+                os.path.join(consts.USER_FILES, f"field_cache_{mw.pm.name}.json"),
+                self.config["field_cache_size"],
+            )
+        self.engine.runs = RunLog(
+            os.path.join(consts.USER_FILES, f"runs_{mw.pm.name}.json")
+        )
+        self.engine.journal = DuplicationJournal(
+            os.path.join(consts.USER_FILES, f"duplication_journal_{mw.pm.name}.json")
+        )
+        self.preview_cancel = CancelToken()
+        # Metrics of the run done by the dialog, if any
+        self.metrics: Optional[RunMetrics] = None
         self.setup_ui(starting_deck_id)
 
     def update_fields(self, did: DeckId) -> None:
         deck_name = self.deck_chooser.selected_deck_name()
         self.form.duplicateDeckNameLineEdit.setText(deck_name + "_dup")
-        self.cids: List[CardId] = []
-        self.fields: List[str] = []
+        self.engine.cancel = CancelToken()
+        self.preview_cancel.cancel()
         self.mw.progress.start(parent=self, label="Getting field names...")
         self.mw.progress.set_title(consts.ADDON_NAME)
 
-        def collect_fields() -> None:
-            self.deck_tree = self.mw.col.decks.children(did) + [(deck_name, did)]
-            self.cids = self.mw.col.decks.cids(did, children=True)
-            for cid in self.cids:
-                card = self.mw.col.get_card(cid)
-                note = card.note()
-                for field in note.keys():
-                    if field not in self.fields:
-                        self.fields.append(field)
-
         def on_done(fut: Future) -> None:
             try:
                 fut.result()
+            except Cancelled:
+                self.engine.fields = []
             finally:
                 self.form.separatorFieldComboBox.clear()
-                self.form.separatorFieldComboBox.addItems(self.fields)
-                parent_deck = self.mw.col.decks.immediate_parent(
-                    self.mw.col.decks.name(did)
-                )
-                if not parent_deck:
-                    parent_deck = ""
-                self.form.parentDeckLineEdit.setText(parent_deck)
+                self.form.separatorFieldComboBox.addItems(self.engine.fields)
+                self.form.parentDeckLineEdit.setText(self.engine.parent_deck())
                 self.mw.progress.finish()
+                self.update_preview()
 
-        self.mw.taskman.run_in_background(collect_fields, on_done=on_done)
+        run_in_background(
+            self.mw, lambda: self.engine.load_deck(did), on_done, "load_deck"
+        )
 
     def setup_ui(self, starting_deck_id: Optional[DeckId]) -> None:
         self.form = Ui_Dialog()
         self.form.setupUi(self)
         self.setWindowTitle(consts.ADDON_LONG_NAME)
         qconnect(self.form.processButton.clicked, self.on_process)
+        qconnect(self.form.batchButton.clicked, self.on_batch)
         if ANKI_POINT_VERSION >= 50:
             self.deck_chooser = MyDeckChooser(
                 self.mw,
@@ -111,136 +322,267 @@ class DeckSeparatorDialog(QDialog):
             self.form.separatorFieldRadioButton.toggled,
             self.form.separatorFieldComboBox.setEnabled,
         )
+        qconnect(
+            self.form.keyExpressionRadioButton.toggled,
+            self.form.keyExpressionLineEdit.setEnabled,
+        )
         qconnect(
             self.form.numberOfCardsRadioButton.toggled,
             self.form.numberOfCardsSpinBox.setEnabled,
         )
+        qconnect(
+            self.form.numberOfCardsRadioButton.toggled,
+            self.form.cardOrderComboBox.setEnabled,
+        )
+        for order, label in CARD_ORDER_LABELS:
+            self.form.cardOrderComboBox.addItem(label, order)
         qconnect(
             self.form.duplicateDeckRadioButton.toggled,
             self.form.duplicateDeckNameLineEdit.setEnabled,
         )
+        for radio_button in self.mode_radio_buttons():
+            qconnect(radio_button.toggled, self.on_mode_toggled)
+        qconnect(
+            self.form.separatorFieldComboBox.currentIndexChanged,
+            self.update_preview,
+        )
+        qconnect(self.form.numberOfCardsSpinBox.valueChanged, self.update_preview)
+        qconnect(self.form.cardOrderComboBox.currentIndexChanged, self.update_preview)
+        qconnect(self.form.duplicateDeckNameLineEdit.textChanged, self.update_preview)
+        qconnect(self.form.parentDeckLineEdit.textChanged, self.update_preview)
+        # Wait for the user to stop typing before reading the cards
+        self.preview_timer = QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.setInterval(300)
+        qconnect(self.preview_timer.timeout, self.update_preview)
+        qconnect(
+            self.form.keyExpressionLineEdit.textChanged,
+            lambda text: self.preview_timer.start(),
+        )
+        self.form.previewTree.header().setSectionResizeMode(
+            0, QHeaderView.ResizeMode.Stretch
+        )
+        self.form.previewTree.header().setStretchLastSection(False)
+
+    def mode_radio_buttons(self) -> Tuple[QRadioButton, ...]:
+        return (
+            self.form.separatorFieldRadioButton,
+            self.form.keyExpressionRadioButton,
+            self.form.numberOfCardsRadioButton,
+            self.form.duplicateDeckRadioButton,
+        )
+
+    def on_mode_toggled(self, checked: bool) -> None:
+        self.form.incrementalCheckBox.setEnabled(
+            self.form.separatorFieldRadioButton.isChecked()
+            or self.form.keyExpressionRadioButton.isChecked()
+        )
+        # Each change of mode toggles two buttons
+        if checked:
+            self.update_preview()
+
+    def separator_key(self) -> str:
+        "The field name or key expression cards are to be separated by, if any."
+        if self.form.separatorFieldRadioButton.isChecked():
+            return self.engine.fields[self.form.separatorFieldComboBox.currentIndex()]
+        if self.form.keyExpressionRadioButton.isChecked():
+            return self.form.keyExpressionLineEdit.text()
+        return ""
+
+    def card_order(self) -> Optional[str]:
+        "The order cards are to be split in by number of cards, if in that mode."
+        if not self.form.numberOfCardsRadioButton.isChecked():
+            return None
+        return self.form.cardOrderComboBox.currentData()
+
+    def check_key_expression(self, text: str) -> str:
+        "Return an error message if `text` isn't a valid key expression."
+        try:
+            expression = KeyExpression(text)
+        except ValueError as exc:
+            return str(exc)
+        for name in expression.names:
+            if name != TAGS and not self.engine.get_field(name):
+                return f"No field named {name} in the selected deck"
+        return ""
+
+    def update_preview(self) -> None:
+        "Show the decks the cards would be moved to with the current options."
+        self.preview_cancel.cancel()
+        self.preview_cancel = cancel = CancelToken()
+        self.form.previewTree.clear()
+        if self.form.separatorFieldComboBox.currentIndex() < 0:
+            self.form.previewLabel.setText("")
+            return
+        separator_field = self.separator_key()
+        number_of_cards = self.form.numberOfCardsSpinBox.value()
+        card_order = self.card_order()
+        duplicate_deck_name = ""
+        if self.form.keyExpressionRadioButton.isChecked():
+            error = (
+                self.check_key_expression(separator_field) if separator_field else ""
+            )
+            if not separator_field or error:
+                self.form.previewLabel.setText(error)
+                return
+        elif self.form.duplicateDeckRadioButton.isChecked():
+            duplicate_deck_name = self.form.duplicateDeckNameLineEdit.text()
+            if not duplicate_deck_name:
+                self.form.previewLabel.setText("")
+                return
+        elif not separator_field and not self.form.numberOfCardsRadioButton.isChecked():
+            return
+
+        def preview(
+            progress: Optional[ProgressReporter] = None,
+            sort_progress: Optional[ProgressReporter] = None,
+        ) -> Tuple[List[Tuple[str, int]], int]:
+            if card_order is not None:
+                self.engine.order_cards(card_order, sort_progress)
+            return self.engine.preview(
+                separator_field,
+                number_of_cards,
+                duplicate_deck_name,
+                self.PREVIEW_LIMIT,
+                progress,
+            )
+
+        if card_order in (None, self.engine.card_order) and (
+            not separator_field or separator_field in self.engine.histograms
+        ):
+            # Cheap enough to do right away, unlike reading the fields or
+            # sorting the cards
+            self.show_preview(*preview())
+            return
+
+        def on_progress(text: str) -> None:
+            def update() -> None:
+                if not cancel.cancelled:
+                    self.form.previewLabel.setText(text)
+
+            self.mw.taskman.run_on_main(update)
+
+        def on_done(fut: Future) -> None:
+            try:
+                rows, total = fut.result()
+            except Cancelled:
+                return
+            if not cancel.cancelled:
+                self.show_preview(rows, total)
+
+        progress = ProgressReporter(
+            on_progress, "Reading {done} out of {total} cards...", cancel
+        )
+        sort_progress = ProgressReporter(
+            on_progress, "Sorted {done} out of {total} cards...", cancel
+        )
+        self.mw.taskman.run_in_background(
+            lambda: preview(progress, sort_progress), on_done=on_done
+        )
+
+    def show_preview(self, rows: List[Tuple[str, int]], total: int) -> None:
+        parent_deck = self.form.parentDeckLineEdit.text()
+        self.form.previewTree.clear()
+        self.form.previewTree.addTopLevelItems(
+            [
+                QTreeWidgetItem([child_deck_name(parent_deck, stem), str(count)])
+                for stem, count in rows
+            ]
+        )
+        if not total:
+            text = "No decks will be created."
+        elif total > len(rows):
+            text = f"{total} decks, showing the first {len(rows)}:"
+        else:
+            text = f"{total} decks:"
+        self.form.previewLabel.setText(text)
 
     def exec(self, force_duplicate_deck: bool = False) -> int:
         self.update_fields(self.deck_chooser.selected_deck_id)
         separator_field = self.config["separator_field"]
         number_of_cards = self.config["number_of_cards"]
         duplicate_deck = self.config["duplicate_deck"] or force_duplicate_deck
+        self.form.incrementalCheckBox.setChecked(self.config["incremental"])
+        self.form.cardOrderComboBox.setCurrentIndex(
+            max(0, self.form.cardOrderComboBox.findData(self.config["card_order"]))
+        )
+        self.form.keyExpressionLineEdit.setText(self.config["key_expression"])
         if duplicate_deck:
-            self.form.separatorFieldRadioButton.toggled.emit(False)
-            self.form.numberOfCardsRadioButton.toggled.emit(False)
-            self.form.duplicateDeckRadioButton.setChecked(True)
-        elif separator_field := self._get_field(self.fields, separator_field):
-            self.form.numberOfCardsRadioButton.toggled.emit(False)
-            self.form.duplicateDeckRadioButton.toggled.emit(False)
+            checked = self.form.duplicateDeckRadioButton
+        elif self.config["separate_by_key"]:
+            checked = self.form.keyExpressionRadioButton
+        elif separator_field := self.engine.get_field(separator_field):
             self.form.separatorFieldComboBox.setCurrentText(separator_field)
-            self.form.separatorFieldRadioButton.setChecked(True)
+            checked = self.form.separatorFieldRadioButton
         else:
-            self.form.separatorFieldRadioButton.toggled.emit(False)
-            self.form.duplicateDeckRadioButton.toggled.emit(False)
-            self.form.numberOfCardsRadioButton.setChecked(True)
             self.form.numberOfCardsSpinBox.setValue(number_of_cards)
+            checked = self.form.numberOfCardsRadioButton
+        for radio_button in self.mode_radio_buttons():
+            if radio_button is not checked:
+                radio_button.toggled.emit(False)
+        checked.setChecked(True)
 
         return super().exec()
 
     def accept(self) -> None:
+        self.preview_cancel.cancel()
         self.deck_chooser.cleanup()
         return super().accept()
 
-    def _get_field(self, fields: List[str], key: str) -> Optional[str]:
-        for field in fields:
-            if key.lower() == field.lower():
-                return field
-        return None
+    def reject(self) -> None:
+        self.engine.cancel.cancel()
+        self.preview_cancel.cancel()
+        return super().reject()
 
-    def _collect_decks(
-        self,
-        separator_field: str,
-        number_of_cards: int,
-        duplicate_deck_name: str,
-        selected_deck_name: str,
-    ) -> Dict[str, List[CardId]]:
-        decks: Dict[str, List[CardId]] = {}
-        if separator_field:
-            for i, cid in enumerate(self.cids):
-                card = self.mw.col.get_card(cid)
-                note = card.note()
-                if separator_field not in note:
-                    continue
-                field_value = strip_html(note[separator_field])
-                if field_value:
-                    decks.setdefault(field_value, [])
-                    decks[field_value].append(cid)
-                if i % 100 == 0:
-                    self.mw.taskman.run_on_main(
-                        lambda i=i: self.mw.progress.update(
-                            f"Processed {i+1} out of {len(self.cids)} cards..."
-                        )
-                    )
-        elif duplicate_deck_name:
-            for i, cid in enumerate(self.cids):
-                card = self.mw.col.get_card(cid)
-                note = card.note()
-                note_type = note.note_type()
-                dup_note = self.mw.col.new_note(note_type["id"])
-                for key, value in note.items():
-                    dup_note[key] = value
-                dup_note.tags = note.tags
-                self.mw.col.add_note(dup_note, DeckId(1))
-                dup_note = self.mw.col.get_note(dup_note.id)
-                new_cids = dup_note.card_ids()
-                for cid_i, cid2 in enumerate(note.card_ids()):
-                    card = self.mw.col.get_card(cid2)
-                    deck_idx = -1
-                    for j, child in enumerate(self.deck_tree):
-                        if card.did == child[1]:
-                            deck_idx = j
-                            break
-                    if deck_idx != -1:
-                        full_name = self.deck_tree[deck_idx][0]
-                        subname = "::".join(self.mw.col.decks.path(full_name)[1:])
-                        if selected_deck_name != full_name:
-                            deck_name = duplicate_deck_name + "::" + subname
-                        else:
-                            # tree root
-                            deck_name = duplicate_deck_name
-                        decks.setdefault(deck_name, [])
-                        decks[deck_name].append(new_cids[cid_i])
-                if i % 100 == 0:
-                    self.mw.taskman.run_on_main(
-                        lambda i=i: self.mw.progress.update(
-                            f"Processed {i+1} out of {len(self.cids)} cards..."
-                        )
-                    )
-        else:
-            pad = math.ceil(math.log10(len(self.cids)))
-            for i, cid_group in enumerate(groups_of_n(self.cids, number_of_cards)):
-                start = str(i * number_of_cards + 1).zfill(pad)
-                end = str((i + 1) * number_of_cards).zfill(pad)
-                if i * number_of_cards != len(self.cids):
-                    group_len = len(self.cids) - i * number_of_cards
-                    cid_group = cid_group[:group_len]
-                deck_name = f"{start}-{end}"
-                decks[deck_name] = cid_group
-                self.mw.taskman.run_on_main(
-                    lambda i=i: self.mw.progress.update(
-                        f"Processed {(i+1) * number_of_cards} out of {len(self.cids)} cards..."
-                    )
-                )
-        return decks
-
-    def _process(self, parent_deck: str, decks: Dict[str, List[CardId]]) -> int:
-        for stem, cids in decks.items():
-            deck_name = stem
-            if parent_deck:
-                deck_name = f"{parent_deck}::{deck_name}"
-            deck_id = self.mw.col.decks.id(deck_name)
-            self.mw.taskman.run_on_main(
-                lambda cids=cids, deck_name=deck_name: self.mw.progress.update(
-                    f"Moving {len(cids)} cards to deck {deck_name}..."
-                )
+    def _on_progress(self, text: str) -> None:
+        report_progress(self.mw, self.engine.cancel, text)
+
+    def on_batch(self) -> None:
+        if self.form.separatorFieldComboBox.currentIndex() < 0:
+            showWarning(
+                "No cards in the selected deck. Please choose another deck.",
+                parent=self,
+                title=consts.ADDON_NAME,
+            )
+            return
+        if self.form.duplicateDeckRadioButton.isChecked():
+            showWarning(
+                "Several decks can't be duplicated at once.",
+                parent=self,
+                title=consts.ADDON_NAME,
             )
-            self.mw.col.set_deck(cids, deck_id)
-        return len(decks)
+            return
+        separator_field = self.separator_key()
+        if self.form.keyExpressionRadioButton.isChecked():
+            try:
+                KeyExpression(separator_field)
+            except ValueError as exc:
+                showWarning(str(exc), parent=self, title=consts.ADDON_NAME)
+                return
+        parent_deck = self.form.parentDeckLineEdit.text()
+        error = parent_deck_error(parent_deck, separator_field)
+        if error:
+            showWarning(error, parent=self, title=consts.ADDON_NAME)
+            return
+        dids = choose_decks(self.mw, self, self.deck_chooser.selected_deck_id)
+        if not dids:
+            return
+
+        def on_success(count: int, metrics: RunMetrics) -> None:
+            self.deck_count = count
+            self.metrics = metrics
+            self.accept()
+
+        run_batch(
+            self.mw,
+            self,
+            dids,
+            parent_deck,
+            separator_field,
+            self.form.numberOfCardsSpinBox.value(),
+            on_success,
+            self.card_order() or "",
+        )
 
     def on_process(self) -> None:
         if self.form.separatorFieldComboBox.currentIndex() < 0:
@@ -250,72 +592,112 @@ class DeckSeparatorDialog(QDialog):
                 title=consts.ADDON_NAME,
             )
             return
-        separator_field = (
-            self.fields[self.form.separatorFieldComboBox.currentIndex()]
-            if self.form.separatorFieldRadioButton.isChecked()
-            else ""
-        )
-        deck_name = self.deck_chooser.selected_deck_name()
+        separate_by_key = self.form.keyExpressionRadioButton.isChecked()
+        separator_field = self.separator_key()
+        if separate_by_key:
+            error = (
+                self.check_key_expression(separator_field)
+                if separator_field
+                else "Please enter a key."
+            )
+            if error:
+                showWarning(error, parent=self, title=consts.ADDON_NAME)
+                return
         parent_deck = self.form.parentDeckLineEdit.text()
         number_of_cards = self.form.numberOfCardsSpinBox.value()
         duplicate_deck = self.form.duplicateDeckRadioButton.isChecked()
         duplicate_deck_name = (
             self.form.duplicateDeckNameLineEdit.text() if duplicate_deck else ""
         )
-        self.config["separator_field"] = separator_field
+        if not separate_by_key:
+            self.config["separator_field"] = separator_field
+        self.config["separate_by_key"] = separate_by_key
+        self.config["key_expression"] = self.form.keyExpressionLineEdit.text()
         self.config["number_of_cards"] = number_of_cards
+        self.config["card_order"] = self.form.cardOrderComboBox.currentData()
         self.config["duplicate_deck"] = duplicate_deck
+        self.config["incremental"] = self.form.incrementalCheckBox.isChecked()
         self.mw.addonManager.writeConfig(__name__, self.config)
+        incremental = bool(separator_field) and self.config["incremental"]
+        started = int(time.time())
+        card_order = self.card_order()
+
+        def count_decks() -> Tuple[int, Optional[Sequence[CardId]]]:
+            if card_order is not None:
+                self.engine.order_cards(card_order)
+            cids = None
+            if incremental:
+                cids = self.engine.changed_cids(separator_field, parent_deck)
+            count = self.engine.count_decks(
+                separator_field, number_of_cards, duplicate_deck_name, cids
+            )
+            return count, cids
 
         def on_done(fut: Future) -> None:
             try:
                 self.deck_count = fut.result()
+                self.metrics = self.engine.metrics
+            except Cancelled:
+                tooltip("Cancelled. No changes were made.", parent=self)
+                return
             finally:
                 self.mw.progress.finish()
             self.accept()
 
-        def on_done_collecting_decks(fut: Future) -> None:
+        def on_done_counting_decks(fut: Future) -> None:
             try:
-                decks = fut.result()
-            except Exception as exc:
-                raise exc
+                count, cids = fut.result()
+            except Cancelled:
+                return
             finally:
                 self.mw.progress.finish()
-            if len(decks) > self.DECK_LIMIT:
-                dialog = askUserDialog(
-                    f"""
-This will result in creating {len(decks)} decks. \
-Note that large deck list trees can break display and result in a blank screen \
-in Anki versions before 2.1.50. Are you sure you want to continue?
-                """,
-                    ["Continue", "Abort"],
-                    self,
-                    title=consts.ADDON_NAME,
-                )
-                dialog.setDefault(1)
-                ret = dialog.run()
-                if ret == "Abort":
-                    return
-            if not decks:
+            if cids is not None and not cids:
+                tooltip("No notes were changed since the last run.", parent=self)
+                return
+            if not confirm_deck_count(self, count):
+                return
+            if not count:
                 if separator_field:
                     showWarning(
-                        "Chosen field is empty in all notes",
+                        (
+                            "Chosen key is empty for all notes"
+                            if separate_by_key
+                            else "Chosen field is empty in all notes"
+                        ),
                         parent=self,
                         title=consts.ADDON_NAME,
                     )
                 return
+            resume = False
+            if duplicate_deck_name and self.engine.can_resume(
+                parent_deck, duplicate_deck_name
+            ):
+                answer = ask_resume(self)
+                if answer is None:
+                    return
+                resume = answer
+
+            def process() -> int:
+                count = self.engine.process(
+                    parent_deck,
+                    separator_field,
+                    number_of_cards,
+                    duplicate_deck_name,
+                    cids,
+                    resume,
+                )
+                if separator_field:
+                    self.engine.record_run(
+                        separator_field, parent_deck, started, cids is not None
+                    )
+                return count
+
+            self.engine.cancel = CancelToken()
             self.mw.progress.start(label="Creating decks...")
             self.mw.progress.set_title(consts.ADDON_NAME)
-            self.mw.taskman.run_in_background(
-                lambda: self._process(parent_deck, decks),
-                on_done=on_done,
-            )
+            run_in_background(self.mw, process, on_done, "process")
 
+        self.engine.cancel = CancelToken()
         self.mw.progress.start(parent=self)
         self.mw.progress.set_title(consts.ADDON_NAME)
-        self.mw.taskman.run_in_background(
-            lambda: self._collect_decks(
-                separator_field, number_of_cards, duplicate_deck_name, deck_name
-            ),
-            on_done=on_done_collecting_decks,
-        )
+        run_in_background(self.mw, count_decks, on_done_counting_decks, "count_decks")
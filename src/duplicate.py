@@ -0,0 +1,238 @@
+import copy
+from typing import Callable, Dict, List, Optional, Tuple, cast
+
+from anki.cards import CardId
+from anki.collection import Collection
+from anki.decks import DeckId
+from anki.models import NotetypeId
+from anki.notes import Note, NoteId
+from anki.utils import guid64, ids2str
+
+from .progress import ProgressReporter
+from .rows import CHUNK_SIZE, split_fields
+from .undo import UndoEntry
+
+try:
+    from anki.collection import AddNoteRequest  # type: ignore
+except ImportError:
+    # Anki versions before 23.10 can only add notes one at a time
+    AddNoteRequest = None  # type: ignore
+
+DEFAULT_DECK_ID = DeckId(1)
+BATCH_SIZE = 500
+# Number of notes duplicated between checkpoints
+CHECKPOINT_SIZE = 5000
+
+# Card template ord -> target deck
+OrdTargets = Dict[int, DeckId]
+NoteRow = Tuple[NoteId, NotetypeId, str, str]
+
+
+def duplicate_notes(
+    col: Collection,
+    targets: Dict[CardId, DeckId],
+    undo: UndoEntry,
+    progress: Optional[ProgressReporter] = None,
+    start_after: NoteId = NoteId(0),
+    on_checkpoint: Optional[Callable[[NoteId], None]] = None,
+) -> List[NoteId]:
+    """Duplicate the notes of the given cards in batches.
+
+    Each duplicated card is placed in the target deck of the original card with
+    the same template. Generated siblings of cards not in `targets` are put in
+    the Default deck. All changes are merged into `undo`. Returns the ids of
+    the added notes.
+
+    Notes are processed in ascending order of their ids, skipping those up to
+    `start_after`. Every CHECKPOINT_SIZE notes, all duplicates so far are put
+    in their decks, the collection is saved, and `on_checkpoint` is called with
+    the id of the last note done, so an interrupted run can be resumed from it.
+    Anki versions that commit each operation as soon as it's done keep the
+    notes added after the last checkpoint, so there checkpoints are made after
+    every batch. Notes duplicated after the last checkpoint by an interrupted
+    run are found when resuming it, and their duplicates reused.
+    """
+    note_targets = _note_targets(col, targets)
+    nids = sorted(nid for nid in note_targets if nid > start_after)
+    if progress:
+        progress.start(len(nids))
+    templates: Dict[NotetypeId, Note] = {}
+    moves: Dict[DeckId, List[CardId]] = {}
+    new_nids: List[NoteId] = []
+    checkpoint_size = CHECKPOINT_SIZE if _saves_on_demand(col) else BATCH_SIZE
+    checkpoint = checkpoint_size
+    resuming = bool(start_after)
+    for start in range(0, len(nids), BATCH_SIZE):
+        batch = nids[start : start + BATCH_SIZE]
+        rows = _note_rows(col, batch)
+        added: Dict[NoteId, NoteId] = {}
+        if resuming:
+            added = _added_duplicates(col, rows, note_targets)
+            # Notes are added in order, so no later note was if one of this
+            # batch wasn't
+            resuming = len(added) == len(rows)
+        dups: List[Tuple[Note, OrdTargets]] = []
+        for nid, mid, flds, tags in rows:
+            if nid in added:
+                continue
+            if mid not in templates:
+                templates[mid] = col.new_note(col.models.get(mid))
+            dup = copy.copy(templates[mid])
+            dup.guid = guid64()
+            dup.fields = split_fields(flds)
+            dup.tags = col.tags.split(tags)
+            dups.append((dup, note_targets[nid]))
+        if dups:
+            _add_notes(col, dups, undo)
+
+        # Cards are added to the deck of the note's first target, so only
+        # siblings that belong elsewhere need moving afterwards
+        ord_targets = {dup.id: ords for dup, ords in dups}
+        new_nids.extend(ord_targets)
+        for nid, dup_nid in added.items():
+            ord_targets[dup_nid] = note_targets[nid]
+        for cid, nid, card_ord, did in col.db.execute(
+            "select id, nid, ord, did from cards "
+            f"where nid in {ids2str(ord_targets)}"
+        ):
+            deck_id = ord_targets[nid].get(card_ord, DEFAULT_DECK_ID)
+            if deck_id != did:
+                moves.setdefault(deck_id, []).append(cid)
+        done = start + len(batch)
+        if done >= checkpoint or done == len(nids):
+            checkpoint = done + checkpoint_size
+            _move_cards(col, moves, undo)
+            moves = {}
+            _save(col)
+            if on_checkpoint:
+                on_checkpoint(batch[-1])
+        if progress:
+            progress.update(done)
+
+    if progress:
+        progress.finish()
+    return new_nids
+
+
+def remove_partial_duplicates(
+    col: Collection, targets: Dict[CardId, DeckId], undo: UndoEntry
+) -> int:
+    """Remove the duplicates an interrupted duplication of the given cards
+    added, so that it can start over, and save the collection. Changes are
+    merged into `undo`. Returns the number of notes removed.
+
+    Notes are duplicated in order of their ids, so their duplicates are looked
+    for (see _added_duplicates()) until one of a batch isn't found.
+    """
+    note_targets = _note_targets(col, targets)
+    nids = sorted(note_targets)
+    dup_nids: List[NoteId] = []
+    for start in range(0, len(nids), BATCH_SIZE):
+        rows = _note_rows(col, nids[start : start + BATCH_SIZE])
+        added = _added_duplicates(col, rows, note_targets)
+        dup_nids.extend(added.values())
+        if len(added) < len(rows):
+            break
+    if dup_nids:
+        col.remove_notes(dup_nids)
+        undo.merge()
+        # Saved before the interrupted run is forgotten
+        _save(col)
+    return len(dup_nids)
+
+
+def _note_targets(
+    col: Collection, targets: Dict[CardId, DeckId]
+) -> Dict[NoteId, OrdTargets]:
+    "Map the notes of the given cards to the target decks of their cards."
+    note_targets: Dict[NoteId, OrdTargets] = {}
+    cids = list(targets)
+    for start in range(0, len(cids), CHUNK_SIZE):
+        chunk = cids[start : start + CHUNK_SIZE]
+        for cid, nid, card_ord in col.db.execute(
+            f"select id, nid, ord from cards where id in {ids2str(chunk)}"
+        ):
+            note_targets.setdefault(nid, {})[card_ord] = targets[cid]
+    return note_targets
+
+
+def _note_rows(col: Collection, nids: List[NoteId]) -> List[NoteRow]:
+    return cast(
+        List[NoteRow],
+        col.db.all(
+            f"select id, mid, flds, tags from notes where id in {ids2str(nids)} "
+            "order by id"
+        ),
+    )
+
+
+def _move_cards(
+    col: Collection, moves: Dict[DeckId, List[CardId]], undo: UndoEntry
+) -> None:
+    for deck_id, moved_cids in moves.items():
+        col.set_deck(moved_cids, deck_id)
+        undo.merge()
+
+
+def _saves_on_demand(col: Collection) -> bool:
+    "Whether changes are only committed when the collection is saved."
+    # Newer versions commit each operation as soon as it's done
+    return hasattr(col.db, "begin")
+
+
+def _save(col: Collection) -> None:
+    if _saves_on_demand(col):
+        col.save()
+
+
+def _added_duplicates(
+    col: Collection,
+    rows: List[NoteRow],
+    note_targets: Dict[NoteId, OrdTargets],
+) -> Dict[NoteId, NoteId]:
+    """Map the notes of `rows` to duplicates of them that an interrupted run
+    added to their target decks after its last checkpoint.
+
+    Duplicates have the same note type, fields and tags as their notes, and
+    are found by the checksum of their first field. They're matched to notes
+    in order of their ids, after the duplicates of earlier notes with the same
+    contents.
+    """
+    target_dids = {did for nid, *_ in rows for did in note_targets[nid].values()}
+    # Notes with the contents of each note of `rows` that aren't to be
+    # duplicated, and the number of earlier notes to be duplicated
+    candidates: Dict[Tuple[NotetypeId, str, Tuple[str, ...]], List[NoteId]] = {}
+    done: Dict[Tuple[NotetypeId, str, Tuple[str, ...]], int] = {}
+    for nid, mid, flds, tags, in_targets in col.db.execute(
+        "select id, mid, flds, tags, "
+        f"id in (select nid from cards where did in {ids2str(target_dids)}) "
+        "from notes where csum in "
+        f"(select csum from notes where id in {ids2str(nid for nid, *_ in rows)}) "
+        "order by id"
+    ):
+        key = (mid, flds, tuple(tags.split()))
+        if nid in note_targets:
+            if nid < rows[0][0]:
+                done[key] = done.get(key, 0) + 1
+        elif in_targets:
+            candidates.setdefault(key, []).append(nid)
+    added: Dict[NoteId, NoteId] = {}
+    for nid, mid, flds, tags in rows:
+        key = (mid, flds, tuple(tags.split()))
+        dup_nids = candidates.get(key, [])[done.get(key, 0) :]
+        if dup_nids:
+            added[nid] = dup_nids[0]
+            done[key] = done.get(key, 0) + 1
+    return added
+
+
+def _add_notes(
+    col: Collection, dups: List[Tuple[Note, OrdTargets]], undo: UndoEntry
+) -> None:
+    if AddNoteRequest:
+        col.add_notes([AddNoteRequest(note, ords[min(ords)]) for note, ords in dups])
+        undo.merge()
+    else:
+        for note, ords in dups:
+            col.add_note(note, ords[min(ords)])
+            undo.merge()
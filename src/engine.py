@@ -0,0 +1,788 @@
+import bisect
+import heapq
+import math
+import threading
+import time
+from array import array
+from typing import (
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    cast,
+)
+
+from anki.cards import CardId
+from anki.collection import Collection
+from anki.decks import DeckId
+from anki.models import NotetypeId
+from anki.notes import NoteId
+from anki.utils import ids2str
+
+from .cache import FieldCache
+from .decks import DeckResolver, child_deck_name, move_cards
+from .duplicate import duplicate_notes, remove_partial_duplicates
+from .journal import DuplicationJournal
+from .keys import TAGS, KeyExpression
+from .metrics import RunMetrics
+from .progress import Cancelled, CancelToken, ProgressReporter
+from .rows import (
+    CHUNK_SIZE,
+    CardRow,
+    card_decks,
+    card_rows,
+    cid_array,
+    field_ord,
+    split_fields,
+)
+from .runs import RunLog
+from .strip import strip_all
+from .undo import UndoEntry
+
+# Maximum number of distinct raw field values whose stripped HTML is
+# remembered, and of distinct keys
+MEMO_SIZE = 100_000
+# Stands for the note's tags among the field indexes a key is made of
+TAGS_ORD = -1
+# Number of cards moved to a deck at a time. Each move takes a backend call
+# and an undo merge, so cards are moved in batches larger than those read at
+# a time.
+MOVE_CHUNK_SIZE = 50_000
+# Due value of a card, which is kept in odue while it's in a filtered deck
+DUE = "(case when c.odid then c.odue else c.due end)"
+# When a card is due, comparable across card types: new cards by position
+# first, then the others by the day they're due on. Learning cards are due at
+# a time in seconds, which is turned into a day counted from the collection's
+# creation time (`crt`), like the due days of review cards.
+CARD_DUE = (
+    f"case when c.type = 0 then {DUE} else 1e15 + "
+    f"case when {DUE} > 1000000000 then ({DUE} - {{crt}}) / 86400.0 else {DUE} end "
+    "end"
+)
+# Orders the cards can be split in by number-of-cards mode, as SQL terms
+# ordering their notes, where `note` is a window over the cards of a note.
+# Terms are formatted with the collection's creation time as `crt`.
+CARD_ORDERS = {
+    # The card of the note due first
+    "due": f"min({CARD_DUE}) over note",
+    "created": "c.nid",
+    "sort_field": "n.sfld collate nocase",
+}
+
+
+class DeckSeparator:
+    """Distributes the cards of a deck tree to other decks, or duplicates them.
+
+    Doesn't depend on Qt, so it can be used outside Anki's GUI. Progress labels
+    are passed to `on_progress`, which is called from the thread doing the work.
+    """
+
+    def __init__(
+        self, col: Collection, on_progress: Optional[Callable[[str], None]] = None
+    ):
+        self.col = col
+        self.on_progress = on_progress
+        self.cancel = CancelToken()
+        self.deck_name = ""
+        self.deck_tree: List[Tuple[str, DeckId]] = []
+        # Deck path of each deck in the tree relative to the tree root,
+        # used to map cards to their decks' duplicates
+        self.deck_subnames: Dict[DeckId, str] = {}
+        # Kept in an array of 64-bit integers rather than a list of ints to
+        # save memory on large decks
+        self.cids: Sequence[CardId] = cid_array([])
+        self.fields: List[str] = []
+        # Key of CARD_ORDERS the loaded cards are in, and the number of cards
+        # of each of their notes, in the same order
+        self.card_order = ""
+        self.note_sizes: Optional[List[int]] = None
+        # Number of loaded cards for each value of a field, by field name
+        self.histograms: Dict[str, Dict[str, int]] = {}
+        self.cache: Optional[FieldCache] = None
+        self.runs: Optional[RunLog] = None
+        self.journal: Optional[DuplicationJournal] = None
+        # Decks the last call to process() moved cards to
+        self.target_dids: List[DeckId] = []
+        # Timings of the run on the loaded deck, logged by process()
+        self.metrics = RunMetrics()
+        # Held while a deck is loaded, so that work on the previous deck done
+        # on another thread can't replace its cards (see order_cards())
+        self.lock = threading.Lock()
+
+    def load_deck(self, did: DeckId) -> None:
+        "Collect the cards of the deck tree rooted at `did` and their fields."
+        with self.lock:
+            self.metrics = RunMetrics()
+            with self.metrics.phase("load_deck") as phase:
+                self._load_deck(did)
+                phase.items = len(self.cids)
+
+    def _load_deck(self, did: DeckId) -> None:
+        self.deck_name = self.col.decks.name(did)
+        self.histograms = {}
+        self.card_order = ""
+        self.note_sizes = None
+        self.deck_tree = self.col.decks.children(did) + [(self.deck_name, did)]
+        self.deck_subnames = {}
+        for full_name, child_did in self.deck_tree:
+            if full_name != self.deck_name:
+                subname = "::".join(self.col.decks.path(full_name)[1:])
+                self.deck_subnames[child_did] = subname
+            else:
+                # tree root
+                self.deck_subnames[child_did] = ""
+        dids = [child[1] for child in self.deck_tree]
+        cached = self.cache.get(self.col, did, dids) if self.cache else None
+        if cached:
+            self.cids, self.fields = cached
+            return
+        self.cids = cid_array(self.col.decks.cids(did, children=True))
+        self.fields = []
+        mids = self._note_type_ids(dids)
+        progress = self.progress_reporter(
+            "Processed {done} out of {total} note types..."
+        )
+        progress.start(len(mids))
+        for i, mid in enumerate(mids):
+            note_type = self.col.models.get(mid)
+            for field in self.col.models.field_names(note_type):
+                if field not in self.fields:
+                    self.fields.append(field)
+            progress.update(i + 1)
+        progress.finish()
+        if self.cache:
+            self.cache.put(self.col, did, dids, mids, self.cids, self.fields)
+
+    def _note_type_ids(self, dids: List[DeckId]) -> List[NotetypeId]:
+        """Return the distinct note types used by cards in the given decks,
+        ordered by the first card using each of them."""
+        return self.col.db.list(
+            "select n.mid from cards c join notes n on c.nid = n.id "
+            f"where c.did in {ids2str(dids)} group by n.mid order by min(c.id)"
+        )
+
+    def parent_deck(self) -> str:
+        "Name of the loaded deck's parent, or an empty string for top-level decks."
+        return self.col.decks.immediate_parent(self.deck_name) or ""
+
+    def get_field(self, key: str) -> Optional[str]:
+        for field in self.fields:
+            if key.lower() == field.lower():
+                return field
+        return None
+
+    def order_cards(
+        self, order: str, progress: Optional[ProgressReporter] = None
+    ) -> None:
+        """Put the loaded cards in `order`, one of CARD_ORDERS, or back in the
+        order they were loaded in if empty. The cards of a note are kept next
+        to each other, and number-of-cards mode then only ends decks between
+        notes, so that siblings end up in the same deck.
+
+        Raises Cancelled if `progress` is cancelled or another deck is loaded
+        in the meantime, leaving the cards of the new deck as they are.
+        """
+        if order == self.card_order:
+            return
+        deck_tree = self.deck_tree
+        did = deck_tree[-1][1]
+        note_sizes: Optional[List[int]] = None
+        if not order:
+            cids: Sequence[CardId] = cid_array(self.col.decks.cids(did, children=True))
+        else:
+            cids, note_sizes = self.ordered_cids(
+                [child[1] for child in deck_tree],
+                order,
+                len(self.cids),
+                progress
+                or self.progress_reporter("Sorted {done} out of {total} cards..."),
+            )
+        with self.lock:
+            if self.deck_tree is not deck_tree:
+                raise Cancelled()
+            self.cids = cids
+            self.card_order = order
+            self.note_sizes = note_sizes
+
+    def ordered_cids(
+        self, dids: List[DeckId], order: str, total: int, progress: ProgressReporter
+    ) -> Tuple[Sequence[CardId], List[int]]:
+        """Return the `total` cards of the given decks in `order`, one of
+        CARD_ORDERS, and the number of cards of each of their notes."""
+        cids: List[CardId] = []
+        note_sizes: List[int] = []
+        last_nid = None
+        progress.start(total)
+        with self.metrics.phase("order_cards", total):
+            for cid, nid in self.col.db.execute(
+                "select c.id, c.nid from cards c join notes n on c.nid = n.id "
+                f"where c.did in {ids2str(dids)} "
+                "window note as (partition by c.nid) "
+                f"order by {CARD_ORDERS[order].format(crt=self.col.crt)}, "
+                "c.nid, c.ord"
+            ):
+                cids.append(cid)
+                if nid == last_nid:
+                    note_sizes[-1] += 1
+                else:
+                    note_sizes.append(1)
+                    last_nid = nid
+                progress.update(len(cids))
+        progress.finish()
+        return cid_array(cids), note_sizes
+
+    def changed_cids(
+        self, separator_field: str, parent_deck: str
+    ) -> Optional[Sequence[CardId]]:
+        """Return the loaded cards that a separation by `separator_field` needs
+        to look at given the last recorded run, or None if there's no record.
+
+        These are the cards whose notes were added or modified since the last
+        run started, the cards modified (e.g. moved by hand) since it finished,
+        and the cards that aren't in one of the decks it moved cards to. The
+        rest are left where the last run put them.
+        """
+        if not self.runs:
+            return None
+        did = self.deck_tree[-1][1]
+        run = self.runs.get(did, separator_field, parent_deck)
+        if not run:
+            return None
+        dids = [child[1] for child in self.deck_tree]
+        return cid_array(
+            self.col.db.list(
+                "select c.id from cards c join notes n on c.nid = n.id "
+                f"where c.did in {ids2str(dids)} "
+                "and (n.mod >= ? or c.mod > ? "
+                f"or c.did not in {ids2str(run['targets'])})",
+                run["started"],
+                # Records written before finish times were kept have none
+                run.get("finished", run["started"]),
+            )
+        )
+
+    def record_run(
+        self, separator_field: str, parent_deck: str, started: int, incremental: bool
+    ) -> None:
+        """Record a separation by `separator_field` started at `started` (in
+        seconds), right after process() is done. The decks of an incremental
+        run are added to those of the runs before it."""
+        if not self.runs:
+            return
+        did = self.deck_tree[-1][1]
+        target_dids = set(self.target_dids)
+        run = self.runs.get(did, separator_field, parent_deck)
+        if incremental and run:
+            target_dids.update(run["targets"])
+        self.runs.put(
+            did,
+            separator_field,
+            parent_deck,
+            started,
+            int(time.time()),
+            list(target_dids),
+        )
+
+    def collect_decks(
+        self,
+        separator_field: str,
+        number_of_cards: int,
+        duplicate_deck_name: str,
+        cids: Optional[Sequence[CardId]] = None,
+    ) -> Dict[str, List[CardId]]:
+        """Group the loaded cards, or `cids` if given, by the name of the deck
+        they should go to.
+
+        Cards are grouped by the value of `separator_field` if given, by their
+        deck's duplicate if `duplicate_deck_name` is given, and in groups of
+        `number_of_cards` otherwise.
+        """
+        decks: Dict[str, List[CardId]] = {}
+        for chunk in self.chunks(
+            separator_field,
+            number_of_cards,
+            duplicate_deck_name,
+            cids,
+            self.progress_reporter("Processed {done} out of {total} cards..."),
+        ):
+            for deck_name, chunk_cids in chunk.items():
+                decks.setdefault(deck_name, []).extend(chunk_cids)
+        return decks
+
+    def count_decks(
+        self,
+        separator_field: str,
+        number_of_cards: int,
+        duplicate_deck_name: str,
+        cids: Optional[Sequence[CardId]] = None,
+    ) -> int:
+        """Return the number of decks collect_decks() would return, only
+        keeping their names in memory."""
+        if cids is None:
+            if separator_field:
+                return len(self.field_histogram(separator_field))
+            cids = self.cids
+        if not separator_field and not duplicate_deck_name:
+            starts = self._note_group_starts(cids, number_of_cards)
+            if starts is not None:
+                return len(starts)
+            return math.ceil(len(cids) / number_of_cards)
+        deck_names: Set[str] = set()
+        with self.metrics.phase("count_decks", len(cids)):
+            for chunk in self.chunks(
+                separator_field,
+                number_of_cards,
+                duplicate_deck_name,
+                cids,
+                self.progress_reporter(
+                    "Counted decks of {done} out of {total} cards..."
+                ),
+            ):
+                deck_names.update(chunk)
+        return len(deck_names)
+
+    def field_histogram(
+        self, separator_field: str, progress: Optional[ProgressReporter] = None
+    ) -> Dict[str, int]:
+        """Return the number of loaded cards for each non-empty value of
+        `separator_field`, which is only computed once per loaded deck."""
+        histogram = self.histograms.get(separator_field)
+        if histogram is not None:
+            return histogram
+        deck_tree = self.deck_tree
+        cids = self.cids
+        histogram = {}
+        with self.metrics.phase("field_histogram", len(cids)):
+            for chunk in self.chunks(
+                separator_field,
+                0,
+                "",
+                cids,
+                progress
+                or self.progress_reporter("Counted {done} out of {total} cards..."),
+            ):
+                for value, chunk_cids in chunk.items():
+                    histogram[value] = histogram.get(value, 0) + len(chunk_cids)
+        with self.lock:
+            # Another deck may have been loaded in the meantime
+            if self.deck_tree is deck_tree:
+                self.histograms[separator_field] = histogram
+        return histogram
+
+    def preview(
+        self,
+        separator_field: str,
+        number_of_cards: int,
+        duplicate_deck_name: str,
+        limit: int,
+        progress: Optional[ProgressReporter] = None,
+    ) -> Tuple[List[Tuple[str, int]], int]:
+        """Return the names and card counts of the first `limit` decks (by name)
+        process() would move the loaded cards to, and the total number of decks.
+
+        Only the first preview by a given field reads the cards' notes.
+        """
+        sizes: Dict[str, int] = {}
+        if separator_field:
+            sizes = self.field_histogram(separator_field, progress)
+        elif duplicate_deck_name:
+            deck_names = self._duplicate_names(duplicate_deck_name)
+            dids = [child[1] for child in self.deck_tree]
+            for did, count in self.col.db.all(
+                "select did, count() from cards "
+                f"where did in {ids2str(dids)} group by did"
+            ):
+                sizes[deck_names[did]] = count
+        else:
+            pad = self._pad(len(self.cids))
+            starts = self._note_group_starts(self.cids, number_of_cards)
+            if starts is not None:
+                bounds = starts + [len(self.cids)]
+                return [
+                    (
+                        self._group_name(bounds[i], bounds[i + 1] - bounds[i], pad),
+                        bounds[i + 1] - bounds[i],
+                    )
+                    for i in range(min(limit, len(starts)))
+                ], len(starts)
+            total = math.ceil(len(self.cids) / number_of_cards)
+            rows = []
+            for group_start in range(
+                0, min(limit, total) * number_of_cards, number_of_cards
+            ):
+                rows.append(
+                    (
+                        self._group_name(group_start, number_of_cards, pad),
+                        min(number_of_cards, len(self.cids) - group_start),
+                    )
+                )
+            return rows, total
+        return heapq.nsmallest(limit, sizes.items()), len(sizes)
+
+    def chunks(
+        self,
+        separator_field: str,
+        number_of_cards: int,
+        duplicate_deck_name: str,
+        cids: Optional[Sequence[CardId]],
+        progress: ProgressReporter,
+        chunk_size: int = CHUNK_SIZE,
+        note_sizes: Optional[List[int]] = None,
+    ) -> Iterator[Dict[str, List[CardId]]]:
+        """Like collect_decks(), but yield the cards grouped by deck name for
+        every `chunk_size` cards, so the same name can appear in several chunks.
+        `note_sizes` are those of ordered_cids() if it gave `cids`."""
+        if cids is None:
+            cids = self.cids
+        progress.start(len(cids))
+        keys_of = self._key_reader(separator_field) if separator_field else None
+        deck_names = self._duplicate_names(duplicate_deck_name)
+        pad = self._pad(len(cids))
+        starts = None
+        if not separator_field and not duplicate_deck_name:
+            starts = self._note_group_starts(cids, number_of_cards, note_sizes)
+        for start in range(0, len(cids), chunk_size):
+            chunk = cids[start : start + chunk_size]
+            decks: Dict[str, List[CardId]] = {}
+            if keys_of:
+                rows = list(card_rows(self.col, chunk))
+                for row, key in zip(rows, keys_of(rows)):
+                    if key:
+                        decks.setdefault(key, []).append(row[0])
+            elif duplicate_deck_name:
+                for cid, did in card_decks(self.col, chunk):
+                    decks.setdefault(deck_names[did], []).append(cid)
+            elif starts is not None:
+                end = start + len(chunk)
+                # Groups overlapping this chunk
+                i = bisect.bisect_right(starts, start) - 1
+                while i < len(starts) and starts[i] < end:
+                    group_end = starts[i + 1] if i + 1 < len(starts) else len(cids)
+                    low = max(starts[i], start) - start
+                    high = min(group_end, end) - start
+                    deck_name = self._group_name(starts[i], group_end - starts[i], pad)
+                    decks[deck_name] = list(chunk[low:high])
+                    i += 1
+            else:
+                end = start + len(chunk)
+                # Groups of number_of_cards overlapping this chunk
+                for group_start in range(
+                    start - start % number_of_cards, end, number_of_cards
+                ):
+                    low = max(group_start, start) - start
+                    high = min(group_start + number_of_cards, end) - start
+                    deck_name = self._group_name(group_start, number_of_cards, pad)
+                    decks[deck_name] = list(chunk[low:high])
+            yield decks
+            progress.update(start + len(chunk))
+        progress.finish()
+
+    def _key_reader(self, separator_field: str) -> Callable[[List[CardRow]], List[str]]:
+        """Compile `separator_field`, a field name or a key expression (see
+        KeyExpression), into a function returning the keys of the notes of
+        the given card rows.
+
+        Stripped field values and keys are memoized by the raw text they come
+        from, as the same values tend to repeat across many notes. The values
+        of each call not stripped before are stripped together (see strip_all()).
+        """
+        expression = KeyExpression(separator_field)
+        # Indexes of the fields the placeholders read in each note type, and
+        # which of them are the note's tags
+        inputs: Dict[NotetypeId, Tuple[List[Optional[int]], Tuple[bool, ...]]] = {}
+        stripped: Dict[str, str] = {}
+        # The tags are placeholder values too, but aren't stripped, so keys
+        # are memoized by which values are tags as well
+        keys: Dict[Tuple[Tuple[bool, ...], Tuple[str, ...]], str] = {}
+        placeholder_count = len(expression.names)
+
+        def keys_of(rows: List[CardRow]) -> List[str]:
+            # Memos are cleared before they're used, so that everything the
+            # rows need stays in them until the end
+            if len(keys) + len(rows) > MEMO_SIZE:
+                keys.clear()
+            if len(stripped) + len(rows) * placeholder_count > MEMO_SIZE:
+                stripped.clear()
+            result: List[str] = []
+            # Positions in `result` of the rows whose keys weren't memoized,
+            # and the rows' raw values
+            missing: List[Tuple[int, Tuple[Tuple[bool, ...], Tuple[str, ...]]]] = []
+            # Raw values of each note of the rows, so that the fields of
+            # notes with several cards are only split once
+            note_values: Dict[NoteId, Tuple[Tuple[bool, ...], Tuple[str, ...]]] = {}
+            for _, nid, mid, flds, tags in rows:
+                memo_key = note_values.get(nid)
+                if memo_key is None:
+                    note_inputs = inputs.get(mid)
+                    if note_inputs is None:
+                        note_inputs = inputs[mid] = self._key_inputs(expression, mid)
+                    ords, tag_positions = note_inputs
+                    fields = split_fields(flds)
+                    raw_values = tuple(
+                        (
+                            tags.strip()
+                            if idx == TAGS_ORD
+                            else "" if idx is None else fields[idx]
+                        )
+                        for idx in ords
+                    )
+                    memo_key = note_values[nid] = (tag_positions, raw_values)
+                key = keys.get(memo_key)
+                if key is None:
+                    missing.append((len(result), memo_key))
+                    key = ""
+                result.append(key)
+            if not missing:
+                return result
+            new_values: Dict[str, None] = {}
+            for _, (tag_positions, raw_values) in missing:
+                for is_tags, raw_value in zip(tag_positions, raw_values):
+                    if not is_tags and raw_value not in stripped:
+                        new_values[raw_value] = None
+            stripped.update(zip(new_values, strip_all(list(new_values))))
+            for i, memo_key in missing:
+                key = keys.get(memo_key)
+                if key is None:
+                    tag_positions, raw_values = memo_key
+                    key = keys[memo_key] = expression.evaluate(
+                        [
+                            raw_value if is_tags else stripped[raw_value]
+                            for is_tags, raw_value in zip(tag_positions, raw_values)
+                        ]
+                    )
+                result[i] = key
+            return result
+
+        return keys_of
+
+    def _key_inputs(
+        self, expression: KeyExpression, mid: NotetypeId
+    ) -> Tuple[List[Optional[int]], Tuple[bool, ...]]:
+        """Return the indexes of the fields of note type `mid` the placeholders
+        of `expression` read, TAGS_ORD for the note's tags, and which of them
+        are the tags. A field named like TAGS is read rather than the tags, and
+        plain field names are always fields."""
+        ords: List[Optional[int]] = []
+        for name in expression.names:
+            idx = field_ord(self.col, mid, name)
+            if idx is None and name == TAGS and not expression.plain:
+                idx = TAGS_ORD
+            ords.append(idx)
+        return ords, tuple(idx == TAGS_ORD for idx in ords)
+
+    def process(
+        self,
+        parent_deck: str,
+        separator_field: str,
+        number_of_cards: int,
+        duplicate_deck_name: str,
+        cids: Optional[Sequence[CardId]] = None,
+        resume: bool = False,
+    ) -> int:
+        """Move the loaded cards, or `cids` if given, to the decks they belong to
+        under `parent_deck`, or duplicate them if `duplicate_deck_name` is given,
+        as a single undoable operation. Returns the number of decks.
+
+        Cards are moved a chunk at a time as they're read, so the whole grouping
+        is never held in memory. If `resume` is set, a duplication continues
+        from the last checkpoint of an interrupted one (see can_resume()).
+        """
+        undo = UndoEntry(
+            self.col, "Duplicate Deck" if duplicate_deck_name else "Separate Deck"
+        )
+        if duplicate_deck_name:
+            title = f"Duplicated {self.deck_name} as {duplicate_deck_name}"
+        elif separator_field:
+            title = f"Separated {self.deck_name} by {separator_field}"
+        else:
+            title = f"Separated {self.deck_name} into decks of {number_of_cards}"
+        try:
+            with self.metrics.phase(
+                "process", len(self.cids if cids is None else cids)
+            ):
+                if duplicate_deck_name:
+                    self._duplicate(
+                        parent_deck,
+                        duplicate_deck_name,
+                        self.collect_decks("", 0, duplicate_deck_name, cids),
+                        undo,
+                        resume,
+                    )
+                else:
+                    self._move_in_chunks(
+                        parent_deck, separator_field, number_of_cards, cids, undo
+                    )
+        except Cancelled:
+            # Everything done so far is part of the same undo step
+            undo.merge()
+            self.col.undo()
+            self.metrics.log(f"{title} (cancelled)")
+            raise
+        self.metrics.count("target decks", len(self.target_dids))
+        self.metrics.log(title)
+        return len(self.target_dids)
+
+    def _move_in_chunks(
+        self,
+        parent_deck: str,
+        separator_field: str,
+        number_of_cards: int,
+        cids: Optional[Sequence[CardId]],
+        undo: UndoEntry,
+    ) -> None:
+        resolver = DeckResolver(self.col, undo)
+        target_dids: Set[DeckId] = set()
+        # Cards waiting to be moved to each deck, kept across chunks so that
+        # each deck takes a move per MOVE_CHUNK_SIZE cards
+        pending: Dict[DeckId, "array[int]"] = {}
+        for chunk in self.chunks(
+            separator_field,
+            number_of_cards,
+            "",
+            cids,
+            self.progress_reporter("Separated {done} out of {total} cards..."),
+        ):
+            for stem, chunk_cids in chunk.items():
+                # Names differing only in case resolve to the same deck
+                did = resolver.id(child_deck_name(parent_deck, stem))
+                target_dids.add(did)
+                buffer = pending.setdefault(did, array("q"))
+                buffer.extend(chunk_cids)
+                if len(buffer) >= MOVE_CHUNK_SIZE:
+                    self._move_cards({did: pending.pop(did)}, undo)
+        self._move_cards(pending, undo)
+        self.metrics.count("decks created", resolver.created)
+        self.target_dids = list(target_dids)
+
+    def _move_cards(self, targets: Dict[DeckId, "array[int]"], undo: UndoEntry) -> None:
+        moved = move_cards(
+            self.col, cast(Mapping[DeckId, Sequence[CardId]], targets), undo
+        )
+        self.metrics.count("cards moved", moved)
+
+    def can_resume(self, parent_deck: str, duplicate_deck_name: str) -> bool:
+        """Whether a duplication of the loaded deck with the same options was
+        interrupted after some of its notes were committed."""
+        if not self.journal:
+            return False
+        did = self.deck_tree[-1][1]
+        return self.journal.get(did, duplicate_deck_name, parent_deck) is not None
+
+    def _duplicate(
+        self,
+        parent_deck: str,
+        duplicate_deck_name: str,
+        decks: Dict[str, List[CardId]],
+        undo: UndoEntry,
+        resume: bool,
+    ) -> None:
+        resolver = DeckResolver(self.col, undo)
+        targets: Dict[CardId, DeckId] = {}
+        progress = self.progress_reporter("Created {done} out of {total} decks...")
+        progress.start(len(decks))
+        for i, (stem, cids) in enumerate(decks.items()):
+            did = resolver.id(child_deck_name(parent_deck, stem))
+            for cid in cids:
+                targets[cid] = did
+            progress.update(i + 1)
+        progress.finish()
+        self.metrics.count("decks created", resolver.created)
+        self.target_dids = list(set(targets.values()))
+
+        journal = self.journal
+        did = self.deck_tree[-1][1]
+        previous = (
+            journal.get(did, duplicate_deck_name, parent_deck) if journal else None
+        )
+        start_after = NoteId(0)
+        if previous and resume:
+            start_after = previous
+        elif previous and journal:
+            # Starting over, so the notes the interrupted run added are removed
+            removed = remove_partial_duplicates(self.col, targets, undo)
+            self.metrics.count("notes removed", removed)
+            journal.remove(did, duplicate_deck_name, parent_deck)
+
+        def on_checkpoint(nid: NoteId) -> None:
+            if journal:
+                journal.put(did, duplicate_deck_name, parent_deck, nid)
+
+        try:
+            new_nids = duplicate_notes(
+                self.col,
+                targets,
+                undo,
+                self.progress_reporter("Duplicated {done} out of {total} notes..."),
+                start_after,
+                on_checkpoint,
+            )
+        except Cancelled:
+            # The changes of this run are undone, including the removal of the
+            # notes of an interrupted run, so the journal is put back as it was
+            if journal:
+                if previous:
+                    journal.put(did, duplicate_deck_name, parent_deck, previous)
+                else:
+                    journal.remove(did, duplicate_deck_name, parent_deck)
+            raise
+        if journal:
+            journal.remove(did, duplicate_deck_name, parent_deck)
+        self.metrics.count("notes added", len(new_nids))
+
+    def _duplicate_names(self, duplicate_deck_name: str) -> Dict[DeckId, str]:
+        "Map the loaded decks to the names of their duplicates."
+        deck_names: Dict[DeckId, str] = {}
+        for did, subname in self.deck_subnames.items():
+            deck_names[did] = duplicate_deck_name
+            if subname:
+                deck_names[did] += "::" + subname
+        return deck_names
+
+    def _note_group_starts(
+        self,
+        cids: Sequence[CardId],
+        number_of_cards: int,
+        note_sizes: Optional[List[int]] = None,
+    ) -> Optional[List[int]]:
+        """Return the positions in `cids` where the decks of number-of-cards mode
+        start if the loaded cards were put in an order by order_cards(), or if
+        `note_sizes` of ordered_cids() are given for `cids`. Decks hold as many
+        whole notes as fit in `number_of_cards`, and notes with more cards get
+        their own deck. Returns None if decks are of exactly `number_of_cards`
+        instead."""
+        if note_sizes is None and cids is self.cids:
+            note_sizes = self.note_sizes
+        if note_sizes is None:
+            return None
+        starts: List[int] = []
+        size = 0
+        position = 0
+        for note_size in note_sizes:
+            if not starts or size + note_size > number_of_cards:
+                starts.append(position)
+                size = 0
+            size += note_size
+            position += note_size
+        return starts
+
+    @staticmethod
+    def _pad(card_count: int) -> int:
+        return math.ceil(math.log10(card_count)) if card_count else 0
+
+    @staticmethod
+    def _group_name(group_start: int, number_of_cards: int, pad: int) -> str:
+        first = str(group_start + 1).zfill(pad)
+        last = str(group_start + number_of_cards).zfill(pad)
+        return f"{first}-{last}"
+
+    def progress_reporter(self, label: str) -> ProgressReporter:
+        return ProgressReporter(self._report_progress, label, self.cancel)
+
+    def _report_progress(self, text: str) -> None:
+        if self.on_progress:
+            self.on_progress(text)
@@ -14,7 +14,7 @@ from PyQt5 import QtCore, QtGui, QtWidgets
 class Ui_Dialog(object):
     def setupUi(self, Dialog):
         Dialog.setObjectName("Dialog")
-        Dialog.resize(512, 327)
+        Dialog.resize(512, 520)
         self.formLayout_2 = QtWidgets.QFormLayout(Dialog)
         self.formLayout_2.setObjectName("formLayout_2")
         self.label_2 = QtWidgets.QLabel(Dialog)
@@ -40,24 +40,56 @@ class Ui_Dialog(object):
         self.separatorFieldComboBox = QtWidgets.QComboBox(self.groupBox)
         self.separatorFieldComboBox.setObjectName("separatorFieldComboBox")
         self.formLayout.setWidget(0, QtWidgets.QFormLayout.FieldRole, self.separatorFieldComboBox)
+        self.keyExpressionRadioButton = QtWidgets.QRadioButton(self.groupBox)
+        self.keyExpressionRadioButton.setObjectName("keyExpressionRadioButton")
+        self.formLayout.setWidget(1, QtWidgets.QFormLayout.LabelRole, self.keyExpressionRadioButton)
+        self.keyExpressionLineEdit = QtWidgets.QLineEdit(self.groupBox)
+        self.keyExpressionLineEdit.setObjectName("keyExpressionLineEdit")
+        self.formLayout.setWidget(1, QtWidgets.QFormLayout.FieldRole, self.keyExpressionLineEdit)
+        self.incrementalCheckBox = QtWidgets.QCheckBox(self.groupBox)
+        self.incrementalCheckBox.setObjectName("incrementalCheckBox")
+        self.formLayout.setWidget(2, QtWidgets.QFormLayout.FieldRole, self.incrementalCheckBox)
         self.numberOfCardsRadioButton = QtWidgets.QRadioButton(self.groupBox)
         self.numberOfCardsRadioButton.setObjectName("numberOfCardsRadioButton")
-        self.formLayout.setWidget(1, QtWidgets.QFormLayout.LabelRole, self.numberOfCardsRadioButton)
+        self.formLayout.setWidget(3, QtWidgets.QFormLayout.LabelRole, self.numberOfCardsRadioButton)
         self.numberOfCardsSpinBox = QtWidgets.QSpinBox(self.groupBox)
         self.numberOfCardsSpinBox.setMinimum(1)
         self.numberOfCardsSpinBox.setMaximum(1000000)
         self.numberOfCardsSpinBox.setObjectName("numberOfCardsSpinBox")
-        self.formLayout.setWidget(1, QtWidgets.QFormLayout.FieldRole, self.numberOfCardsSpinBox)
+        self.formLayout.setWidget(3, QtWidgets.QFormLayout.FieldRole, self.numberOfCardsSpinBox)
+        self.cardOrderComboBox = QtWidgets.QComboBox(self.groupBox)
+        self.cardOrderComboBox.setObjectName("cardOrderComboBox")
+        self.formLayout.setWidget(4, QtWidgets.QFormLayout.FieldRole, self.cardOrderComboBox)
         self.duplicateDeckRadioButton = QtWidgets.QRadioButton(self.groupBox)
         self.duplicateDeckRadioButton.setObjectName("duplicateDeckRadioButton")
-        self.formLayout.setWidget(2, QtWidgets.QFormLayout.LabelRole, self.duplicateDeckRadioButton)
+        self.formLayout.setWidget(5, QtWidgets.QFormLayout.LabelRole, self.duplicateDeckRadioButton)
         self.duplicateDeckNameLineEdit = QtWidgets.QLineEdit(self.groupBox)
         self.duplicateDeckNameLineEdit.setObjectName("duplicateDeckNameLineEdit")
-        self.formLayout.setWidget(2, QtWidgets.QFormLayout.FieldRole, self.duplicateDeckNameLineEdit)
+        self.formLayout.setWidget(5, QtWidgets.QFormLayout.FieldRole, self.duplicateDeckNameLineEdit)
         self.formLayout_2.setWidget(2, QtWidgets.QFormLayout.SpanningRole, self.groupBox)
+        self.previewGroupBox = QtWidgets.QGroupBox(Dialog)
+        self.previewGroupBox.setObjectName("previewGroupBox")
+        self.verticalLayout = QtWidgets.QVBoxLayout(self.previewGroupBox)
+        self.verticalLayout.setObjectName("verticalLayout")
+        self.previewLabel = QtWidgets.QLabel(self.previewGroupBox)
+        self.previewLabel.setText("")
+        self.previewLabel.setObjectName("previewLabel")
+        self.verticalLayout.addWidget(self.previewLabel)
+        self.previewTree = QtWidgets.QTreeWidget(self.previewGroupBox)
+        self.previewTree.setRootIsDecorated(False)
+        self.previewTree.setUniformRowHeights(True)
+        self.previewTree.setObjectName("previewTree")
+        self.verticalLayout.addWidget(self.previewTree)
+        self.formLayout_2.setWidget(3, QtWidgets.QFormLayout.SpanningRole, self.previewGroupBox)
+        self.buttonLayout = QtWidgets.QHBoxLayout()
+        self.buttonLayout.setObjectName("buttonLayout")
+        self.batchButton = QtWidgets.QPushButton(Dialog)
+        self.batchButton.setObjectName("batchButton")
+        self.buttonLayout.addWidget(self.batchButton)
         self.processButton = QtWidgets.QPushButton(Dialog)
         self.processButton.setObjectName("processButton")
-        self.formLayout_2.setWidget(3, QtWidgets.QFormLayout.FieldRole, self.processButton)
+        self.buttonLayout.addWidget(self.processButton)
+        self.formLayout_2.setLayout(4, QtWidgets.QFormLayout.FieldRole, self.buttonLayout)
 
         self.retranslateUi(Dialog)
         QtCore.QMetaObject.connectSlotsByName(Dialog)
@@ -68,6 +100,17 @@ class Ui_Dialog(object):
         self.label_2.setText(_translate("Dialog", "Deck"))
         self.label.setText(_translate("Dialog", "Parent deck"))
         self.separatorFieldRadioButton.setText(_translate("Dialog", "Separate by field contents"))
+        self.keyExpressionRadioButton.setText(_translate("Dialog", "Separate by key"))
+        self.keyExpressionLineEdit.setToolTip(_translate("Dialog", "Text with placeholders such as {{Front}} or {{Tags}}, optionally followed by filters: {{Front|first:3}}, {{Tags|tag:Lang|level:2}}, {{Back|re:(\\d+)}}"))
+        self.keyExpressionLineEdit.setPlaceholderText(_translate("Dialog", "{{Field|first:1}}"))
+        self.incrementalCheckBox.setToolTip(_translate("Dialog", "Leave cards whose notes weren\'t changed since the last separation by this field where it put them"))
+        self.incrementalCheckBox.setText(_translate("Dialog", "Only notes changed since the last run"))
         self.numberOfCardsRadioButton.setText(_translate("Dialog", "Separate by number of cards"))
+        self.cardOrderComboBox.setToolTip(_translate("Dialog", "Order the cards are split in. Cards of the same note are kept in the same deck when an order is chosen."))
         self.duplicateDeckRadioButton.setText(_translate("Dialog", "Duplicate deck as"))
+        self.previewGroupBox.setTitle(_translate("Dialog", "Preview"))
+        self.previewTree.headerItem().setText(0, _translate("Dialog", "Deck"))
+        self.previewTree.headerItem().setText(1, _translate("Dialog", "Cards"))
+        self.batchButton.setToolTip(_translate("Dialog", "Choose several decks and separate them all with these options in one go"))
+        self.batchButton.setText(_translate("Dialog", "Process several decks..."))
         self.processButton.setText(_translate("Dialog", "Process"))
@@ -0,0 +1,55 @@
+from typing import Any, Dict
+
+from anki.decks import DeckId
+from aqt import gui_hooks, mw
+from aqt.qt import *
+
+from . import consts
+
+# The dialog and the engine are only imported once the add-on is first used,
+# to keep Anki's startup fast (see bench/import_time.py)
+
+
+def on_action_triggered() -> None:
+    from .dialog import DeckSeparatorDialog, show_result
+
+    dialog = DeckSeparatorDialog(mw, mw)
+    if dialog.exec():
+        show_result(mw, f"Processed {dialog.deck_count} decks", dialog.metrics)
+        mw.reset()
+
+
+def on_job_triggered(job: Dict[str, Any]) -> None:
+    from .dialog import run_job
+
+    run_job(mw, job)
+
+
+def on_deck_browser_will_show_options_menu(menu: QMenu, did: int) -> None:
+    def duplicate() -> None:
+        from .dialog import DeckSeparatorDialog, show_result
+
+        dialog = DeckSeparatorDialog(mw, mw, starting_deck_id=DeckId(did))
+        if dialog.exec(force_duplicate_deck=True):
+            show_result(mw, "Duplicated deck", dialog.metrics)
+            mw.reset()
+
+    action = menu.addAction("Duplicate")
+    qconnect(action.triggered, duplicate)
+
+
+def init() -> None:
+    config = mw.addonManager.getConfig(__name__)
+    a = QAction(consts.ADDON_NAME, mw)
+    a.setShortcut(config["shortcut"])
+    qconnect(a.triggered, on_action_triggered)
+    mw.form.menuTools.addSeparator()
+    mw.form.menuTools.addAction(a)
+    if config["batch_jobs"]:
+        menu = mw.form.menuTools.addMenu(f"{consts.ADDON_NAME} Jobs")
+        for job in config["batch_jobs"]:
+            action = menu.addAction(job["name"])
+            qconnect(action.triggered, lambda _, job=job: on_job_triggered(job))
+    gui_hooks.deck_browser_will_show_options_menu.append(
+        on_deck_browser_will_show_options_menu
+    )
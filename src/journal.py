@@ -0,0 +1,55 @@
+import json
+import os
+from typing import Dict, Optional
+
+from anki.decks import DeckId
+from anki.notes import NoteId
+
+from .cache import write_json
+
+
+class DuplicationJournal:
+    """Progress of unfinished duplications, saved to a file so that a run
+    interrupted by a crash can be resumed.
+
+    Notes are duplicated in ascending order of their ids, so each record only
+    holds the id of the last source note whose duplicates were committed.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, NoteId] = {}
+        try:
+            with open(path, encoding="utf-8") as file:
+                self.entries.update(json.load(file))
+        except (OSError, ValueError):
+            pass
+
+    @staticmethod
+    def key(did: DeckId, duplicate_deck_name: str, parent_deck: str) -> str:
+        return json.dumps([did, duplicate_deck_name, parent_deck])
+
+    def get(
+        self, did: DeckId, duplicate_deck_name: str, parent_deck: str
+    ) -> Optional[NoteId]:
+        return self.entries.get(self.key(did, duplicate_deck_name, parent_deck))
+
+    def put(
+        self,
+        did: DeckId,
+        duplicate_deck_name: str,
+        parent_deck: str,
+        last_nid: NoteId,
+    ) -> None:
+        self.entries[self.key(did, duplicate_deck_name, parent_deck)] = last_nid
+        self.save()
+
+    def remove(self, did: DeckId, duplicate_deck_name: str, parent_deck: str) -> None:
+        if self.entries.pop(self.key(did, duplicate_deck_name, parent_deck), None):
+            self.save()
+
+    def save(self) -> None:
+        if self.entries:
+            write_json(self.path, self.entries)
+        elif os.path.exists(self.path):
+            os.remove(self.path)
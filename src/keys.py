@@ -0,0 +1,144 @@
+import re
+from typing import Callable, List, Optional, Sequence, Union
+
+TAGS = "Tags"
+PLACEHOLDER_RE = re.compile(r"\{\{(.*?)\}\}")
+
+Filter = Callable[[str], str]
+
+
+def _first(arg: str) -> Filter:
+    count = _positive_int("first", arg)
+    return lambda value: value[:count]
+
+
+def _level(arg: str) -> Filter:
+    count = _positive_int("level", arg)
+    return lambda value: "::".join(value.split("::")[:count])
+
+
+def _tag(arg: str) -> Filter:
+    prefix = arg.lower()
+
+    def apply(value: str) -> str:
+        for tag in value.split():
+            if not prefix or tag.lower() == prefix:
+                return tag
+            if tag.lower().startswith(prefix + "::"):
+                return tag
+        return ""
+
+    return apply
+
+
+def _regex(arg: str) -> Filter:
+    try:
+        pattern = re.compile(arg)
+    except re.error as exc:
+        raise ValueError(f"Invalid regular expression {arg!r}: {exc}") from exc
+
+    def apply(value: str) -> str:
+        match = pattern.search(value)
+        if not match:
+            return ""
+        return (match.group(1) if pattern.groups else match.group(0)) or ""
+
+    return apply
+
+
+def _positive_int(name: str, arg: str) -> int:
+    if not arg.isdigit() or not int(arg):
+        raise ValueError(f"{name}: expects a positive number, got {arg!r}")
+    return int(arg)
+
+
+FILTERS = {"first": _first, "level": _level, "tag": _tag, "re": _regex}
+
+
+class Placeholder:
+    def __init__(self, name: str, filters: Optional[List[Filter]] = None):
+        self.name = name
+        self.filters = filters or []
+
+    @classmethod
+    def parse(cls, text: str) -> "Placeholder":
+        "Parse the text between the braces of a placeholder."
+        name, _, rest = text.partition("|")
+        if not name.strip():
+            raise ValueError(f"Missing field name in {{{{{text}}}}}")
+        filters: List[Filter] = []
+        while rest:
+            # A regular expression takes the rest of the placeholder,
+            # so it can contain |
+            if rest.startswith("re:"):
+                filters.append(_regex(rest[3:]))
+                break
+            spec, _, rest = rest.partition("|")
+            filter_name, _, arg = spec.partition(":")
+            make_filter = FILTERS.get(filter_name.strip())
+            if not make_filter:
+                raise ValueError(f"Unknown filter {filter_name!r} in {{{{{text}}}}}")
+            filters.append(make_filter(arg.strip()))
+        return cls(name.strip(), filters)
+
+    def apply(self, value: str) -> str:
+        for apply_filter in self.filters:
+            value = apply_filter(value)
+        return value
+
+
+class KeyExpression:
+    """The key cards are grouped by, compiled once from a field name or from
+    text with placeholders such as {{Front}} or {{Tags|tag:Lang|level:2}}.
+
+    Placeholders take a field's text, or the note's tags for {{Tags}} if the
+    note type has no field of that name, and optionally filters separated by |:
+      - first:N, the first N characters
+      - level:N, the first N levels of a hierarchy such as a::b::c
+      - tag:PREFIX, the first tag that is PREFIX or under it (any tag if empty)
+      - re:PATTERN, the first match of a regular expression (or of its first
+        group if it has one), which must be the last filter
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self.parts: List[Union[str, Placeholder]] = []
+        # A plain field name, which is always read as a field, even Tags
+        self.plain = "{{" not in text
+        if self.plain:
+            self.parts.append(Placeholder(text))
+            return
+        pos = 0
+        for match in PLACEHOLDER_RE.finditer(text):
+            self._add_text(text[pos : match.start()])
+            self.parts.append(Placeholder.parse(match.group(1)))
+            pos = match.end()
+        self._add_text(text[pos:])
+
+    def _add_text(self, text: str) -> None:
+        if "{{" in text or "}}" in text:
+            raise ValueError(f"Unbalanced braces in {self.text!r}")
+        if text:
+            self.parts.append(text)
+
+    @property
+    def placeholders(self) -> List[Placeholder]:
+        return [part for part in self.parts if isinstance(part, Placeholder)]
+
+    @property
+    def names(self) -> List[str]:
+        "Names of the fields (or TAGS) the placeholders read, in order."
+        return [placeholder.name for placeholder in self.placeholders]
+
+    def evaluate(self, values: Sequence[str]) -> str:
+        """Return the key given the text of each placeholder's field, or an
+        empty string if all placeholders are empty after filtering."""
+        parts = []
+        empty = True
+        values_iter = iter(values)
+        for part in self.parts:
+            if isinstance(part, Placeholder):
+                part = part.apply(next(values_iter))
+                empty = empty and not part
+            parts.append(part)
+        return "" if empty else "".join(parts)
@@ -0,0 +1,112 @@
+import cProfile
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+from typing import Callable, Dict, Iterator, List, Optional, TypeVar
+
+from . import consts
+
+LOG_PATH = os.path.join(consts.USER_FILES, "deck_separator.log")
+PROFILES_DIR = os.path.join(consts.USER_FILES, "profiles")
+
+T = TypeVar("T")
+
+
+def get_logger() -> logging.Logger:
+    "The add-on's logger, which writes to a file in its user_files folder."
+    logger = logging.getLogger("deck_separator")
+    if not logger.handlers:
+        os.makedirs(os.path.dirname(LOG_PATH), exist_ok=True)
+        handler = RotatingFileHandler(
+            LOG_PATH, maxBytes=1_000_000, backupCount=1, encoding="utf-8"
+        )
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
+
+
+def peak_memory() -> Optional[int]:
+    """Peak resident memory of the process since it started in bytes, if it
+    can be found. It covers everything before the current run too."""
+    try:
+        import resource
+    except ImportError:
+        # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS and in kilobytes elsewhere
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Phase:
+    def __init__(self, name: str):
+        self.name = name
+        # Number of cards (or notes) the phase went through
+        self.items = 0
+        self.seconds = 0.0
+
+    def __str__(self) -> str:
+        text = f"{self.name}: {self.seconds:.2f}s"
+        if self.items:
+            text += f", {self.items} items"
+            if self.seconds:
+                text += f" ({self.items / self.seconds:.0f}/s)"
+        return text
+
+
+class RunMetrics:
+    """Wall time and throughput of the phases of a run, and counts of what
+    it did, such as the number of decks created."""
+
+    def __init__(self) -> None:
+        self.phases: List[Phase] = []
+        self.counts: Dict[str, int] = {}
+
+    @contextmanager
+    def phase(self, name: str, items: int = 0) -> Iterator[Phase]:
+        "Time the body of a with block. Phases that raise are recorded too."
+        phase = Phase(name)
+        phase.items = items
+        start = time.perf_counter()
+        try:
+            yield phase
+        finally:
+            phase.seconds = time.perf_counter() - start
+            self.phases.append(phase)
+
+    def count(self, name: str, number: int = 1) -> None:
+        self.counts[name] = self.counts.get(name, 0) + number
+
+    def summary(self, separator: str = "; ") -> str:
+        parts = [str(phase) for phase in self.phases]
+        parts.extend(f"{name}: {number}" for name, number in self.counts.items())
+        peak = peak_memory()
+        if peak is not None:
+            parts.append(f"process peak RSS: {peak / 1024 ** 2:.0f} MB")
+        return separator.join(parts)
+
+    def log(self, title: str) -> None:
+        get_logger().info("%s - %s", title, self.summary())
+
+
+def profiled(func: Callable[[], T], name: str) -> Callable[[], T]:
+    """Wrap `func` so that a cProfile profile of each call is written to
+    PROFILES_DIR, to be opened with pstats or a viewer such as snakeviz."""
+
+    def run() -> T:
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(func)
+        finally:
+            os.makedirs(PROFILES_DIR, exist_ok=True)
+            stamp = time.strftime("%Y%m%d-%H%M%S")
+            path = os.path.join(PROFILES_DIR, f"{name}-{stamp}.prof")
+            profile.dump_stats(path)
+            get_logger().info("Profile of %s written to %s", name, path)
+
+    return run
@@ -0,0 +1,74 @@
+import time
+from typing import Callable, Optional
+
+# Minimum number of seconds between progress updates
+INTERVAL = 0.1
+# Number of items processed between clock checks
+CHECK_EVERY = 64
+
+
+class Cancelled(Exception):
+    pass
+
+
+class CancelToken:
+    "Lets the main thread ask a background operation to stop."
+
+    def __init__(self) -> None:
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+    def check(self) -> None:
+        if self.cancelled:
+            raise Cancelled()
+
+
+class ProgressReporter:
+    """Reports the progress of a long-running loop at a limited rate.
+
+    `label` is formatted with the `done` and `total` counts and passed to
+    `callback` at most once per INTERVAL, and on finish() unless the total was
+    the last count reported. update() is cheap enough to be called for every
+    item of a loop. If a `cancel` token is given, update() raises Cancelled once
+    it has been cancelled.
+    """
+
+    def __init__(
+        self,
+        callback: Callable[[str], None],
+        label: str,
+        cancel: Optional[CancelToken] = None,
+    ):
+        self.callback = callback
+        self.label = label
+        self.cancel = cancel
+        self.start(0)
+
+    def start(self, total: int) -> None:
+        self.total = total
+        self._next_check = 0
+        self._next_time = 0.0
+        # Last count passed to the callback
+        self._reported: Optional[int] = None
+
+    def update(self, done: int) -> None:
+        if done < self._next_check:
+            return
+        self._next_check = done + CHECK_EVERY
+        if self.cancel:
+            self.cancel.check()
+        now = time.monotonic()
+        if now < self._next_time:
+            return
+        self._next_time = now + INTERVAL
+        self._report(done)
+
+    def finish(self) -> None:
+        if self._reported != self.total:
+            self._report(self.total)
+
+    def _report(self, done: int) -> None:
+        self._reported = done
+        self.callback(self.label.format(done=done, total=self.total))
@@ -0,0 +1,48 @@
+import json
+from typing import Any, Dict, List, Optional
+
+from anki.decks import DeckId
+
+from .cache import write_json
+
+
+class RunLog:
+    """Records of past separations by field, saved to a file.
+
+    Each record holds the times a run started and finished and the decks it
+    moved cards to, which is enough to find the cards a later run needs to look at.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        try:
+            with open(path, encoding="utf-8") as file:
+                self.entries.update(json.load(file))
+        except (OSError, ValueError):
+            pass
+
+    @staticmethod
+    def key(did: DeckId, field: str, parent_deck: str) -> str:
+        return json.dumps([did, field, parent_deck])
+
+    def get(
+        self, did: DeckId, field: str, parent_deck: str
+    ) -> Optional[Dict[str, Any]]:
+        return self.entries.get(self.key(did, field, parent_deck))
+
+    def put(
+        self,
+        did: DeckId,
+        field: str,
+        parent_deck: str,
+        started: int,
+        finished: int,
+        target_dids: List[DeckId],
+    ) -> None:
+        self.entries[self.key(did, field, parent_deck)] = {
+            "started": started,
+            "finished": finished,
+            "targets": sorted(target_dids),
+        }
+        write_json(self.path, self.entries)
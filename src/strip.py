@@ -0,0 +1,43 @@
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+import anki.collection
+
+try:
+    from anki.utils import strip_html
+except ImportError:
+    from anki.utils import stripHTML as strip_html
+
+# Newer versions strip HTML in the Rust backend, which releases the GIL while
+# working, so stripping on several threads runs in parallel. Older versions
+# use Python regular expressions.
+PARALLEL = hasattr(anki.collection, "StripHtmlMode")
+
+# Total length of the values below which they're stripped on the calling
+# thread, as starting threads would take longer than the work itself
+PARALLEL_MIN_CHARS = 1_000_000
+WORKERS = min(4, os.cpu_count() or 1)
+# Number of batches given to each worker, so that a batch of long values
+# doesn't keep the others waiting
+BATCHES_PER_WORKER = 4
+
+
+def strip_all(values: List[str]) -> List[str]:
+    """Strip the HTML of `values`, returning the results in the same order.
+    Large inputs are split in batches stripped on a thread pool."""
+    if (
+        not PARALLEL
+        or WORKERS < 2
+        or sum(len(value) for value in values) < PARALLEL_MIN_CHARS
+    ):
+        return [strip_html(value) for value in values]
+    size = math.ceil(len(values) / (WORKERS * BATCHES_PER_WORKER))
+    batches = [values[start : start + size] for start in range(0, len(values), size)]
+    with ThreadPoolExecutor(WORKERS) as pool:
+        return [value for batch in pool.map(_strip_batch, batches) for value in batch]
+
+
+def _strip_batch(values: List[str]) -> List[str]:
+    return [strip_html(value) for value in values]
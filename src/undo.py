@@ -0,0 +1,16 @@
+from anki.collection import Collection
+
+
+class UndoEntry:
+    """Combines the operations performed after its creation into a single undo step.
+
+    Anki only keeps a limited number of undo steps, so merge() should be called
+    after every few operations for the entry to survive long runs.
+    """
+
+    def __init__(self, col: Collection, name: str):
+        self.col = col
+        self.target = col.add_custom_undo_entry(name)
+
+    def merge(self) -> None:
+        self.col.merge_undo_entries(self.target)
@@ -0,0 +1,59 @@
+from pathlib import Path
+from typing import Callable, Dict, Iterator, Sequence
+
+import pytest
+
+# Imported before the add-on, as importing anki.cards first fails on some versions
+from anki.collection import Collection
+from anki.lang import set_lang
+from anki.notes import Note
+
+from src import metrics
+
+AddNote = Callable[..., Note]
+
+# Done by Anki on startup. Newer versions strip HTML with the language's backend.
+set_lang("en")
+
+
+def deck_counts(col: Collection) -> Dict[str, int]:
+    "Number of cards in each deck, by deck name."
+    return {
+        col.decks.name(did): count
+        for did, count in col.db.all("select did, count() from cards group by did")
+    }
+
+
+@pytest.fixture(autouse=True, scope="session")
+def log_path(tmp_path_factory: pytest.TempPathFactory) -> None:
+    "Keep the logs of the runs out of the add-on's user_files folder."
+    metrics.LOG_PATH = str(tmp_path_factory.mktemp("logs") / "deck_separator.log")
+
+
+@pytest.fixture
+def col(tmp_path: Path) -> Iterator[Collection]:
+    col = Collection(str(tmp_path / "collection.anki2"))
+    yield col
+    # Tests may close the collection to reopen it
+    if col.db:
+        col.close()
+
+
+@pytest.fixture
+def add_note(col: Collection) -> AddNote:
+    "Add a note to a deck, creating the deck if needed."
+
+    def add(
+        deck: str,
+        fields: Dict[str, str],
+        tags: Sequence[str] = (),
+        note_type: str = "Basic",
+    ) -> Note:
+        note = col.new_note(col.models.by_name(note_type))
+        for name, value in fields.items():
+            note[name] = value
+        note.tags = list(tags)
+        col.add_note(note, col.decks.id(deck))
+        return note
+
+    return add
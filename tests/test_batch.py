@@ -0,0 +1,74 @@
+import pytest
+from anki.collection import Collection
+
+from src.batch import BatchSeparator, parent_deck_error
+from tests.conftest import AddNote, deck_counts
+
+
+def test_separate_several_decks(col: Collection, add_note: AddNote) -> None:
+    for deck in ["Parent::A", "Parent::B", "Parent::A::Child"]:
+        for front in "xy":
+            add_note(deck, {"Front": front})
+    batch = BatchSeparator(col)
+    # Decks inside other chosen decks are part of their ancestors
+    batch.load_decks(
+        [
+            col.decks.id_for_name(name)
+            for name in ["Parent::A", "Parent::B", "Parent::A::Child"]
+        ]
+    )
+    assert [source.name for source in batch.sources] == ["Parent::A", "Parent::B"]
+    decks = batch.collect_decks("{deck}", "Front", 0)
+    assert {name: len(cids) for name, cids in decks.items()} == {
+        "Parent::A::x": 2,
+        "Parent::A::y": 2,
+        "Parent::B::x": 1,
+        "Parent::B::y": 1,
+    }
+    assert batch.process(decks) == 4
+    assert deck_counts(col) == {name: len(cids) for name, cids in decks.items()}
+    col.undo()
+    assert deck_counts(col) == {
+        "Parent::A": 2,
+        "Parent::B": 2,
+        "Parent::A::Child": 2,
+    }
+
+
+def test_separate_several_decks_in_order(col: Collection, add_note: AddNote) -> None:
+    notes = {}
+    for deck in ["A", "B"]:
+        for front in "cab":
+            notes[deck, front] = add_note(deck, {"Front": front, "Back": "back"})
+    notes["A", "d"] = add_note(
+        "A", {"Front": "d", "Back": "back"}, (), "Basic (and reversed card)"
+    )
+    batch = BatchSeparator(col)
+    batch.load_decks([col.decks.id_for_name(name) for name in "AB"], "sort_field")
+    decks = batch.collect_decks("{deck}", "", 2)
+    assert {name: sorted(cids) for name, cids in decks.items()} == {
+        f"{deck}::{name}": sorted(
+            cid for front in fronts for cid in notes[deck, front].card_ids()
+        )
+        for deck, name, fronts in [
+            ("A", "1-2", "ab"),
+            ("A", "3-3", "c"),
+            ("A", "4-5", "d"),
+            ("B", "1-2", "ab"),
+            ("B", "3-3", "c"),
+        ]
+    }
+
+
+@pytest.mark.parametrize(
+    "parent_deck, separator_field, mixes",
+    [
+        ("{parent}", "", True),
+        ("Chunks", "", True),
+        ("{deck}", "", False),
+        ("Chunks::{deck}", "", False),
+        ("{parent}", "Front", False),
+    ],
+)
+def test_parent_deck_error(parent_deck: str, separator_field: str, mixes: bool) -> None:
+    assert bool(parent_deck_error(parent_deck, separator_field)) == mixes
@@ -0,0 +1,96 @@
+import os
+from pathlib import Path
+from typing import List
+
+import pytest
+from anki.collection import Collection
+from anki.decks import DeckId
+
+from src.cache import FieldCache
+from src.engine import DeckSeparator
+from tests.conftest import AddNote
+
+
+def tree(col: Collection, name: str) -> List[DeckId]:
+    did = col.decks.id_for_name(name)
+    return [child[1] for child in col.decks.children(did)] + [did]
+
+
+@pytest.fixture
+def cache(tmp_path: Path) -> FieldCache:
+    return FieldCache(str(tmp_path / "field_cache.json"), 2)
+
+
+def test_engine_uses_cache(
+    col: Collection, add_note: AddNote, cache: FieldCache
+) -> None:
+    for front in "ab":
+        add_note("Source::Sub", {"Front": front})
+    engine = DeckSeparator(col)
+    engine.cache = cache
+    engine.load_deck(col.decks.id_for_name("Source"))
+    loaded = list(engine.cids)
+    cached = cache.get(col, col.decks.id_for_name("Source"), tree(col, "Source"))
+    assert cached and list(cached[0]) == loaded
+    assert cached[1] == ["Front", "Back"]
+    # A new instance reads the files
+    reloaded = FieldCache(cache.path, 2)
+    engine.cache = reloaded
+    engine.load_deck(col.decks.id_for_name("Source"))
+    assert list(engine.cids) == loaded
+
+
+def test_cards_are_not_in_the_index(
+    col: Collection, add_note: AddNote, cache: FieldCache
+) -> None:
+    add_note("Source", {"Front": "a"})
+    did = col.decks.id_for_name("Source")
+    cache.put(col, did, [did], [], col.decks.cids(did), ["Front"])
+    with open(cache.path, encoding="utf-8") as file:
+        assert "cids" not in file.read()
+
+
+def test_revalidated_entry_isnt_saved(
+    col: Collection,
+    add_note: AddNote,
+    cache: FieldCache,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    add_note("Source", {"Front": "a"})
+    did = col.decks.id_for_name("Source")
+    cache.put(col, did, [did], [], col.decks.cids(did), ["Front"])
+    cache.entries[str(did)]["col_mod"] -= 1
+    monkeypatch.setattr(cache, "save", lambda: pytest.fail("saved"))
+    assert cache.get(col, did, [did])
+    assert cache.entries[str(did)]["col_mod"] == col.mod
+
+
+def test_changed_deck_isnt_reused(
+    col: Collection, add_note: AddNote, cache: FieldCache
+) -> None:
+    add_note("Source", {"Front": "a"})
+    did = col.decks.id_for_name("Source")
+    cache.put(col, did, [did], [], col.decks.cids(did), ["Front"])
+    cache.entries[str(did)]["col_mod"] -= 1
+    add_note("Source", {"Front": "b"})
+    assert cache.get(col, did, [did]) is None
+    assert not os.path.exists(cache._cids_path(str(did)))
+
+
+def test_least_recently_used_entry_is_evicted(
+    col: Collection, add_note: AddNote, cache: FieldCache
+) -> None:
+    dids = []
+    for name in ["First", "Second", "Third"]:
+        add_note(name, {"Front": name})
+        did = col.decks.id_for_name(name)
+        dids.append(did)
+        cache.put(col, did, [did], [], col.decks.cids(did), ["Front"])
+        if name == "Second":
+            # First is now used more recently than Second
+            assert cache.get(col, dids[0], [dids[0]])
+    assert cache.get(col, dids[1], [dids[1]]) is None
+    assert not os.path.exists(cache._cids_path(str(dids[1])))
+    for did in (dids[0], dids[2]):
+        cached = cache.get(col, did, [did])
+        assert cached and list(cached[0]) == col.decks.cids(did)
@@ -0,0 +1,242 @@
+from pathlib import Path
+from typing import Any, Callable
+
+import pytest
+from anki.collection import Collection
+
+from src import cli, consts, duplicate
+from src.engine import DeckSeparator
+from src.journal import DuplicationJournal
+from src.progress import Cancelled
+from tests.conftest import AddNote, deck_counts
+
+
+class Crash(Exception):
+    pass
+
+
+def make_source(add_note: AddNote, notes: int = 25) -> None:
+    # Some notes have the same contents
+    for i in range(notes):
+        deck = "Source::Sub" if i % 3 else "Source"
+        if i % 2:
+            add_note(
+                deck,
+                {"Front": f"f{i % 5}", "Back": "back"},
+                (),
+                "Basic (and reversed card)",
+            )
+        else:
+            add_note(deck, {"Front": f"f{i}"}, ["tagged"])
+
+
+def load(col: Collection, tmp_path: Path) -> DeckSeparator:
+    engine = DeckSeparator(col)
+    engine.journal = DuplicationJournal(str(tmp_path / "journal.json"))
+    engine.load_deck(col.decks.id_for_name("Source"))
+    return engine
+
+
+def fail_on_call(
+    func: Callable[..., None], number: int, error: Exception
+) -> Callable[..., None]:
+    "Wrap `func` so that its `number`th call raises `error`."
+    calls = [0]
+
+    def wrapper(*args: Any) -> None:
+        calls[0] += 1
+        if calls[0] == number:
+            raise error
+        func(*args)
+
+    return wrapper
+
+
+@pytest.fixture
+def small_batches(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(duplicate, "BATCH_SIZE", 2)
+    # Not a multiple of the batch size on purpose
+    monkeypatch.setattr(duplicate, "CHECKPOINT_SIZE", 5)
+
+
+def test_duplicate_deck(col: Collection, add_note: AddNote, tmp_path: Path) -> None:
+    make_source(add_note)
+    before = deck_counts(col)
+    note_count = col.note_count()
+    assert load(col, tmp_path).process("", "", 0, "Copy") == 2
+    counts = deck_counts(col)
+    assert counts["Copy"] == counts["Source"]
+    assert counts["Copy::Sub"] == counts["Source::Sub"]
+    assert col.note_count() == 2 * note_count
+    # Each note has a copy with the same fields and tags
+    copies = col.db.all("select flds, tags, count() from notes group by flds, tags")
+    assert all(count % 2 == 0 for _, _, count in copies)
+    col.undo()
+    assert deck_counts(col) == before
+    assert col.note_count() == note_count
+
+
+@pytest.mark.usefixtures("small_batches")
+def test_cancelled_duplication_is_undone(
+    col: Collection, add_note: AddNote, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    make_source(add_note)
+    before = deck_counts(col)
+    note_count = col.note_count()
+    engine = load(col, tmp_path)
+    monkeypatch.setattr(
+        duplicate, "_add_notes", fail_on_call(duplicate._add_notes, 6, Cancelled())
+    )
+    with pytest.raises(Cancelled):
+        engine.process("", "", 0, "Copy")
+    assert col.note_count() == note_count
+    assert deck_counts(col) == before
+    assert not engine.can_resume("", "Copy")
+
+
+def crash(
+    col: Collection,
+    monkeypatch: pytest.MonkeyPatch,
+    run: Callable[[], Any],
+    target: Any = DuplicationJournal,
+    name: str = "put",
+    number: int = 2,
+) -> str:
+    """Call `run` with the `number`th call to `target.name` crashing, by
+    default after the notes of the second checkpoint are committed but before
+    it's recorded, then close the collection without saving. Returns its path."""
+    path = col.path
+    with monkeypatch.context() as patch:
+        patch.setattr(
+            target, name, fail_on_call(getattr(target, name), number, Crash())
+        )
+        with pytest.raises(Crash):
+            run()
+    # Lose what wasn't committed, as a crash would
+    if hasattr(col.db, "begin"):
+        col.close(save=False)
+    else:
+        col.close()
+    return path
+
+
+def assert_duplicated(col: Collection, note_count: int) -> None:
+    counts = deck_counts(col)
+    assert counts["Copy"] == counts["Source"]
+    assert counts["Copy::Sub"] == counts["Source::Sub"]
+    assert col.note_count() == 2 * note_count
+
+
+@pytest.mark.usefixtures("small_batches")
+@pytest.mark.parametrize(
+    "target, name, number",
+    [
+        # While adding notes
+        (duplicate, "_add_notes", 6),
+        # After the notes of a checkpoint are committed, before it's recorded
+        (DuplicationJournal, "put", 2),
+    ],
+)
+def test_resume_after_crash(
+    col: Collection,
+    add_note: AddNote,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    target: Any,
+    name: str,
+    number: int,
+) -> None:
+    make_source(add_note)
+    note_count = col.note_count()
+    engine = load(col, tmp_path)
+    path = crash(
+        col,
+        monkeypatch,
+        lambda: engine.process("", "", 0, "Copy"),
+        target,
+        name,
+        number,
+    )
+
+    col = Collection(path)
+    try:
+        engine = load(col, tmp_path)
+        assert engine.can_resume("", "Copy")
+        assert not engine.can_resume("", "Other")
+        engine.process("", "", 0, "Copy", resume=True)
+        assert_duplicated(col, note_count)
+        assert not engine.can_resume("", "Copy")
+    finally:
+        col.close()
+
+
+@pytest.mark.usefixtures("small_batches")
+def test_start_over_after_crash(
+    col: Collection, add_note: AddNote, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    make_source(add_note)
+    note_count = col.note_count()
+    engine = load(col, tmp_path)
+    path = crash(col, monkeypatch, lambda: engine.process("", "", 0, "Copy"))
+
+    col = Collection(path)
+    try:
+        assert col.note_count() > note_count
+        engine = load(col, tmp_path)
+        engine.process("", "", 0, "Copy")
+        # The notes the crashed run added were removed first
+        assert_duplicated(col, note_count)
+        assert engine.metrics.counts["notes removed"]
+        assert not engine.can_resume("", "Copy")
+    finally:
+        col.close()
+
+
+@pytest.mark.usefixtures("small_batches")
+def test_cancelled_start_over(
+    col: Collection, add_note: AddNote, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    make_source(add_note)
+    engine = load(col, tmp_path)
+    path = crash(col, monkeypatch, lambda: engine.process("", "", 0, "Copy"))
+
+    col = Collection(path)
+    try:
+        before = deck_counts(col)
+        note_count = col.note_count()
+        engine = load(col, tmp_path)
+        monkeypatch.setattr(
+            duplicate, "_add_notes", fail_on_call(duplicate._add_notes, 2, Cancelled())
+        )
+        with pytest.raises(Cancelled):
+            engine.process("", "", 0, "Copy")
+        # The removed notes are back, and the crashed run can still be resumed
+        assert deck_counts(col) == before
+        assert col.note_count() == note_count
+        assert engine.can_resume("", "Copy")
+    finally:
+        col.close()
+
+
+@pytest.mark.usefixtures("small_batches")
+@pytest.mark.parametrize("resume", [False, True])
+def test_cli_after_crash(
+    col: Collection,
+    add_note: AddNote,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    resume: bool,
+) -> None:
+    monkeypatch.setattr(consts, "USER_FILES", str(tmp_path / "user_files"))
+    make_source(add_note)
+    note_count = col.note_count()
+    argv = [col.path, "Source", "--duplicate", "Copy", "--parent", ""]
+    path = crash(col, monkeypatch, lambda: cli.run(col, cli.parse_args(argv)))
+
+    col = Collection(path)
+    try:
+        args = cli.parse_args(argv + ["--resume"] if resume else argv)
+        assert cli.run(col, args) == 0
+        assert_duplicated(col, note_count)
+    finally:
+        col.close()
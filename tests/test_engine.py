@@ -0,0 +1,299 @@
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import pytest
+from anki.cards import CardId
+from anki.collection import Collection
+
+from src import engine as engine_module
+from src.engine import DeckSeparator
+from src.progress import Cancelled, CancelToken, ProgressReporter
+from src.runs import RunLog
+from tests.conftest import AddNote, deck_counts
+
+
+def load(col: Collection, deck: str) -> DeckSeparator:
+    engine = DeckSeparator(col)
+    engine.load_deck(col.decks.id_for_name(deck))
+    return engine
+
+
+def test_separate_by_field(col: Collection, add_note: AddNote) -> None:
+    for front in ["<b>a</b>", "a", "b", ""]:
+        add_note("Source", {"Front": front})
+    engine = load(col, "Source")
+    assert engine.fields == ["Front", "Back"]
+    assert engine.process("Out", "Front", 0, "") == 2
+    assert deck_counts(col) == {"Out::a": 2, "Out::b": 1, "Source": 1}
+
+
+def test_separate_by_key_expression(col: Collection, add_note: AddNote) -> None:
+    add_note("Source", {"Front": "one"}, ["lang::fr::north"], "Basic")
+    add_note("Source", {"Front": "two"}, ["misc", "lang::de"], "Basic")
+    add_note("Source", {"Front": "three"}, ["misc"], "Basic")
+    engine = load(col, "Source")
+    engine.process("", "{{Tags|tag:lang|level:2}}", 0, "")
+    assert deck_counts(col) == {"lang::fr": 1, "lang::de": 1, "Source": 1}
+
+
+def add_note_type(col: Collection, name: str, fields: List[str]) -> None:
+    models = col.models
+    note_type = models.new(name)
+    for field in fields:
+        models.add_field(note_type, models.new_field(field))
+    template = models.new_template("Card 1")
+    template["qfmt"] = "{{%s}}" % fields[0]
+    template["afmt"] = "{{FrontSide}}"
+    models.add_template(note_type, template)
+    models.add(note_type)
+
+
+def test_field_named_tags(col: Collection, add_note: AddNote) -> None:
+    add_note_type(col, "Tagged", ["Word", "Tags"])
+    for i in range(4):
+        add_note(
+            "Source",
+            {"Word": f"w{i}", "Tags": f"fieldtag{i % 2}"},
+            ["realtag"],
+            "Tagged",
+        )
+    add_note("Source", {"Front": "basic"}, ["basictag"])
+    engine = load(col, "Source")
+    # A plain field name is always a field
+    rows, _ = engine.preview("Tags", 0, "", 10)
+    assert rows == [("fieldtag0", 2), ("fieldtag1", 2)]
+    # So is {{Tags}} in note types with such a field, and the tags otherwise
+    rows, _ = engine.preview("{{Tags}}", 0, "", 10)
+    assert rows == [("basictag", 1), ("fieldtag0", 2), ("fieldtag1", 2)]
+
+
+def test_process_is_undoable(col: Collection, add_note: AddNote) -> None:
+    for front in "abc":
+        add_note("Source::Sub", {"Front": front})
+    before = deck_counts(col)
+    load(col, "Source").process("Out", "Front", 0, "")
+    assert deck_counts(col) != before
+    col.undo()
+    assert deck_counts(col) == before
+
+
+def test_moves_each_deck_in_batches(
+    col: Collection, add_note: AddNote, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(engine_module, "MOVE_CHUNK_SIZE", 3)
+    for front in "aaaab":
+        add_note("Source", {"Front": front})
+    moves: List[int] = []
+    set_deck = col.set_deck
+    monkeypatch.setattr(
+        col,
+        "set_deck",
+        lambda cids, did: moves.append(len(cids)) or set_deck(cids, did),
+    )
+    load(col, "Source").process("Out", "Front", 0, "")
+    assert deck_counts(col) == {"Out::a": 4, "Out::b": 1}
+    # The cards of a deck are moved once there are at least MOVE_CHUNK_SIZE of
+    # them, and the rest at the end
+    assert sorted(moves) == [1, 4]
+
+
+def test_groups_of_number_of_cards(col: Collection, add_note: AddNote) -> None:
+    for i in range(5):
+        add_note("Source", {"Front": str(i)}, note_type="Basic")
+    engine = load(col, "Source")
+    decks = engine.collect_decks("", 2, "")
+    assert [len(cids) for cids in decks.values()] == [2, 2, 1]
+    assert list(decks) == ["1-2", "3-4", "5-6"]
+    assert engine.count_decks("", 2, "") == 3
+
+
+@pytest.mark.parametrize("order", ["due", "created", "sort_field"])
+def test_ordered_groups_keep_siblings_together(
+    col: Collection, add_note: AddNote, order: str
+) -> None:
+    for i in range(30):
+        note_type = "Basic (and reversed card)" if i % 3 else "Basic"
+        add_note(
+            "Source", {"Front": f"{(i * 7) % 30:02}", "Back": "back"}, (), note_type
+        )
+    engine = load(col, "Source")
+    engine.order_cards(order)
+    assert max(engine.note_sizes) == 2
+    nid_of = {cid: nid for cid, nid in col.db.all("select id, nid from cards")}
+    nids = [nid_of[cid] for cid in engine.cids]
+    if order == "created":
+        assert nids == sorted(nids)
+    for number_of_cards in (1, 2, 3, 7):
+        decks = engine.collect_decks("", number_of_cards, "")
+        assert sorted(cid for cids in decks.values() for cid in cids) == sorted(
+            engine.cids
+        )
+        deck_of_note: Dict[int, str] = {}
+        for name, cids in decks.items():
+            assert len(cids) <= number_of_cards or len({nid_of[c] for c in cids}) == 1
+            for cid in cids:
+                assert deck_of_note.setdefault(nid_of[cid], name) == name
+        # Groups spanning several chunks are put together the same way
+        chunked: Dict[str, List[CardId]] = {}
+        for chunk in engine.chunks(
+            "", number_of_cards, "", None, engine.progress_reporter(""), chunk_size=4
+        ):
+            for name, cids in chunk.items():
+                chunked.setdefault(name, []).extend(cids)
+        assert chunked == decks
+        assert engine.count_decks("", number_of_cards, "") == len(decks)
+        rows, total = engine.preview("", number_of_cards, "", 5)
+        assert total == len(decks)
+        assert rows == [(name, len(cids)) for name, cids in list(decks.items())[:5]]
+
+
+def test_due_order_across_card_types(col: Collection, add_note: AddNote) -> None:
+    crt = col.crt
+    # Card type, queue and due of each note's card, in the expected order
+    cards = [
+        (0, 0, 5),
+        # Learning, due at a time a day after the collection's creation
+        (1, 1, crt + 86400 + 3600),
+        # Relearning, due at a time in the learning queue
+        (3, 1, crt + 2 * 86400 + 3600),
+        (2, 2, 3),
+        # Relearning, due on a day in the day learning queue
+        (3, 3, 4),
+        (2, 2, 10),
+    ]
+    notes = [add_note("Source", {"Front": str(i)}) for i in range(len(cards))]
+    # Notes created last are due first
+    notes.reverse()
+    for note, (card_type, queue, due) in zip(notes, cards):
+        col.db.execute(
+            "update cards set type = ?, queue = ?, due = ? where nid = ?",
+            card_type,
+            queue,
+            due,
+            note.id,
+        )
+    engine = load(col, "Source")
+    engine.order_cards("due")
+    nids = [
+        col.db.scalar("select nid from cards where id = ?", cid) for cid in engine.cids
+    ]
+    assert nids == [note.id for note in notes]
+
+
+def test_order_cards_back_to_loaded_order(col: Collection, add_note: AddNote) -> None:
+    for front in "cba":
+        add_note("Source", {"Front": front})
+    engine = load(col, "Source")
+    loaded = list(engine.cids)
+    engine.order_cards("sort_field")
+    assert list(engine.cids) != loaded
+    engine.order_cards("")
+    assert list(engine.cids) == loaded
+    assert engine.note_sizes is None
+
+
+def test_order_cards_after_deck_changes(col: Collection, add_note: AddNote) -> None:
+    for front in "cba":
+        add_note("First", {"Front": front})
+        add_note("Second", {"Front": front})
+    engine = load(col, "First")
+
+    def load_second(text: str) -> None:
+        # Another thread loads a deck while the cards of the first are sorted
+        if engine.deck_name == "First":
+            engine.load_deck(col.decks.id_for_name("Second"))
+
+    with pytest.raises(Cancelled):
+        engine.order_cards("sort_field", ProgressReporter(load_second, ""))
+    assert sorted(engine.cids) == sorted(
+        col.decks.cids(col.decks.id_for_name("Second"))
+    )
+    assert engine.card_order == ""
+    assert engine.note_sizes is None
+
+
+def test_cancelled_order_cards(col: Collection, add_note: AddNote) -> None:
+    for front in "cba":
+        add_note("Source", {"Front": front})
+    engine = load(col, "Source")
+    loaded = list(engine.cids)
+    cancel = CancelToken()
+    cancel.cancel()
+    with pytest.raises(Cancelled):
+        engine.order_cards(
+            "sort_field", ProgressReporter(lambda text: None, "", cancel)
+        )
+    assert list(engine.cids) == loaded
+    assert engine.card_order == ""
+
+
+def test_field_histogram_after_deck_changes(col: Collection, add_note: AddNote) -> None:
+    for front in "aab":
+        add_note("Source", {"Front": front})
+    add_note("Other", {"Front": "c"})
+    engine = load(col, "Source")
+    assert engine.field_histogram("Front") == {"a": 2, "b": 1}
+    assert engine.histograms == {"Front": {"a": 2, "b": 1}}
+
+    engine = load(col, "Source")
+    other = col.decks.id_for_name("Other")
+    # Load another deck while the histogram is being counted
+    progress = ProgressReporter(lambda text: engine.load_deck(other), "")
+    assert engine.field_histogram("Front", progress) == {"a": 2, "b": 1}
+    assert engine.histograms == {}
+
+
+def test_changed_cids(col: Collection, add_note: AddNote, tmp_path: Path) -> None:
+    notes = [add_note("Source", {"Front": front}) for front in "aab"]
+    # Make the notes look older than the run
+    col.db.execute("update notes set mod = mod - 10")
+    runs = RunLog(str(tmp_path / "runs.json"))
+    engine = load(col, "Source")
+    engine.runs = runs
+    assert engine.changed_cids("Front", "Source") is None
+    started = int(time.time())
+    engine.process("Source", "Front", 0, "")
+    engine.record_run("Front", "Source", started, False)
+
+    engine = load(col, "Source")
+    engine.runs = runs
+    assert list(engine.changed_cids("Front", "Source")) == []
+    note = col.get_note(notes[0].id)
+    note["Front"] = "b"
+    col.update_note(note)
+    moved = notes[2].card_ids()[0]
+    col.set_deck([moved], col.decks.id("Source"))
+    engine = load(col, "Source")
+    engine.runs = runs
+    changed = engine.changed_cids("Front", "Source")
+    assert sorted(changed) == sorted([*notes[0].card_ids(), moved])
+    engine.process("Source", "Front", 0, "", changed)
+    engine.record_run("Front", "Source", started, True)
+    assert deck_counts(col) == {"Source::a": 1, "Source::b": 2}
+
+
+def test_changed_cids_moved_by_hand(
+    col: Collection, add_note: AddNote, tmp_path: Path
+) -> None:
+    notes = [add_note("Source", {"Front": front}) for front in "ab"]
+    col.db.execute("update notes set mod = mod - 10")
+    runs = RunLog(str(tmp_path / "runs.json"))
+    engine = load(col, "Source")
+    engine.runs = runs
+    started = int(time.time())
+    engine.process("Source", "Front", 0, "")
+    engine.record_run("Front", "Source", started, False)
+    # Make the run's moves look older than its end, and its end older than now
+    col.db.execute("update cards set mod = mod - 10")
+    for entry in runs.entries.values():
+        entry["finished"] -= 5
+
+    moved = notes[0].card_ids()[0]
+    col.set_deck([moved], col.decks.id("Source::b"))
+    engine = load(col, "Source")
+    engine.runs = runs
+    changed = engine.changed_cids("Front", "Source")
+    assert list(changed) == [moved]
+    engine.process("Source", "Front", 0, "", changed)
+    assert deck_counts(col) == {"Source::a": 1, "Source::b": 1}
@@ -0,0 +1,59 @@
+import pytest
+
+from src.keys import TAGS, KeyExpression
+
+
+def test_plain_field_name() -> None:
+    expression = KeyExpression("Front")
+    assert expression.names == ["Front"]
+    assert expression.evaluate(["word"]) == "word"
+
+
+def test_placeholders_and_text() -> None:
+    expression = KeyExpression("{{Lang}}::{{Front|first:1}}")
+    assert expression.names == ["Lang", "Front"]
+    assert expression.evaluate(["fr", "bonjour"]) == "fr::b"
+
+
+def test_empty_placeholders_give_empty_key() -> None:
+    expression = KeyExpression("Level {{Level}}")
+    assert expression.evaluate([""]) == ""
+    assert expression.evaluate(["2"]) == "Level 2"
+
+
+@pytest.mark.parametrize(
+    "text, value, key",
+    [
+        ("{{Tags|level:2}}", "a::b::c", "a::b"),
+        ("{{Tags|tag:lang}}", "misc Lang::French", "Lang::French"),
+        ("{{Tags|tag:}}", "first second", "first"),
+        ("{{Tags|tag:lang}}", "language", ""),
+        ("{{Front|re:(\\d+)}}", "chapter 12", "12"),
+        ("{{Front|re:a|b}}", "xbx", "b"),
+        ("{{Front|re:\\d}}", "none", ""),
+        ("{{Tags|tag:lang|level:1}}", "lang::fr::north", "lang"),
+    ],
+)
+def test_filters(text: str, value: str, key: str) -> None:
+    assert KeyExpression(text).evaluate([value]) == key
+
+
+def test_tags_placeholder() -> None:
+    assert KeyExpression("{{Tags}}").names == [TAGS]
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "{{Front",
+        "{{Front}}}}",
+        "{{}}",
+        "{{Front|nope:1}}",
+        "{{Front|first:0}}",
+        "{{Front|level:x}}",
+        "{{Front|re:(}}",
+    ],
+)
+def test_invalid_expressions(text: str) -> None:
+    with pytest.raises(ValueError):
+        KeyExpression(text)
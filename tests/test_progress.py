@@ -0,0 +1,18 @@
+from typing import List
+
+from src.progress import ProgressReporter
+
+
+def test_finish_reports_the_total_once() -> None:
+    labels: List[str] = []
+    progress = ProgressReporter(labels.append, "{done}/{total}")
+    progress.start(3)
+    progress.update(0)
+    progress.finish()
+    assert labels == ["0/3", "3/3"]
+
+    labels.clear()
+    progress.start(3)
+    progress.update(3)
+    progress.finish()
+    assert labels == ["3/3"]